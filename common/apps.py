@@ -2,4 +2,13 @@ from django.apps import AppConfig
 
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'common'
\ No newline at end of file
+    name = 'common'
+
+    def ready(self):
+        from celery import signals
+
+        from . import metrics
+
+        signals.task_prerun.connect(metrics.task_prerun)
+        signals.task_postrun.connect(metrics.task_postrun)
+        signals.worker_process_shutdown.connect(metrics.worker_process_shutdown)
@@ -0,0 +1,285 @@
+import hashlib
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from rest_framework.response import Response
+
+from common.db_router import note_write
+from common.metrics import record_cache
+
+
+GENERATION_KEY = "generation:{label}"
+LOCK_KEY = "lock:{key}"
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+# Пауза между проверками кэша, пока значение считает другой процесс
+LOCK_POLL_INTERVAL = 0.05
+
+# expires_at — мягкий срок (time.time()), delta — сколько секунд считалось значение
+CacheEntry = namedtuple("CacheEntry", ["value", "expires_at", "delta"])
+
+
+def get_redis():
+    """Прямое соединение с Redis или None, если кэш не на Redis"""
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+class LocalLRUCache:
+    """Потокобезопасный LRU в памяти процесса с TTL на запись"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def _generation_key(model):
+    return GENERATION_KEY.format(label=model._meta.label_lower)
+
+
+def _initial_generation():
+    # Стартуем со времени, чтобы после вытеснения ключа счётчик не вернулся
+    # к уже использованному значению и не оживил старые записи
+    return time.time_ns()
+
+
+def get_generations(models):
+    """Возвращает текущие поколения моделей за один запрос к кэшу"""
+    keys = [_generation_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            value = _initial_generation()
+            if not cache.add(key, value, timeout=None):
+                value = cache.get(key, value)
+            found[key] = value
+    return [found[key] for key in keys]
+
+
+async def aget_generations(models):
+    keys = [_generation_key(model) for model in models]
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            value = _initial_generation()
+            if not await cache.aadd(key, value, timeout=None):
+                value = await cache.aget(key, value)
+            found[key] = value
+    return [found[key] for key in keys]
+
+
+def bump_generation(model):
+    """Инвалидирует все закэшированные ответы, зависящие от модели, за O(1)"""
+    note_write(model)
+    key = _generation_key(model)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        value = _initial_generation()
+        if cache.add(key, value, timeout=None):
+            return value
+        return cache.incr(key)
+
+
+def acquire_lock(key, timeout):
+    """Токен блокировки key или None, если её держит другой процесс.
+    Без Redis — через cache.add, при ошибке Redis блокировки нет"""
+    name = LOCK_KEY.format(key=key)
+    token = uuid.uuid4().hex
+    redis = get_redis()
+    if redis is None:
+        return token if cache.add(name, token, timeout) else None
+    try:
+        acquired = redis.set(name, token, nx=True, px=int(timeout * 1000))
+    except RedisError:
+        return token
+    return token if acquired else None
+
+
+def release_lock(key, token):
+    name = LOCK_KEY.format(key=key)
+    redis = get_redis()
+    if redis is None:
+        if cache.get(name) == token:
+            cache.delete(name)
+        return
+    try:
+        # Удаляем, только если блокировка ещё наша, а не истекла и перехвачена
+        redis.eval(RELEASE_LOCK_SCRIPT, 1, name, token)
+    except RedisError:
+        pass
+
+
+def _store(key, compute, timeout, stale_timeout):
+    started = time.time()
+    value = compute()
+    now = time.time()
+    entry = CacheEntry(value, now + timeout, now - started)
+    cache.set(key, entry, timeout=timeout + stale_timeout)
+    return value
+
+
+def _should_refresh(entry, beta):
+    """Вероятностное досрочное истечение (XFetch): чем ближе срок и чем
+    дольше считается значение, тем вероятнее пересчёт заранее"""
+    early = -entry.delta * beta * math.log(1.0 - random.random())
+    return time.time() + early >= entry.expires_at
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None, beta=None):
+    """Значение key из кэша или compute() без лавины пересчётов.
+
+    Пересчитывает только взявший блокировку процесс. После мягкого срока
+    timeout остальные stale_timeout секунд получают старое значение;
+    при полном промахе ждут до CACHE_LOCK_WAIT и считают сами, только если
+    значение так и не появилось.
+
+    Возвращает (значение, результат): "hit", "stale", "miss" или "refresh" —
+    пересчёт устаревшего или досрочно истёкшего значения"""
+    if stale_timeout is None:
+        stale_timeout = settings.CACHE_STALE_TIMEOUT
+    if beta is None:
+        beta = settings.CACHE_EARLY_EXPIRATION_BETA
+
+    entry = cache.get(key)
+    if not isinstance(entry, CacheEntry):
+        entry = None
+    if entry is not None and not _should_refresh(entry, beta):
+        return entry.value, "hit"
+
+    token = acquire_lock(key, settings.CACHE_LOCK_TIMEOUT)
+    if token is None:
+        if entry is not None:
+            return entry.value, "stale"
+        deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = cache.get(key)
+            if isinstance(entry, CacheEntry):
+                return entry.value, "hit"
+        # Держатель блокировки не успел: считаем сами, чтобы не висеть
+        return _store(key, compute, timeout, stale_timeout), "miss"
+    try:
+        value = _store(key, compute, timeout, stale_timeout)
+    finally:
+        release_lock(key, token)
+    return value, "miss" if entry is None else "refresh"
+
+
+def get_auth_scope(request, per_user=False):
+    user = request.user
+    if not user.is_authenticated:
+        return "anon"
+    scope = "staff" if user.is_staff else "user"
+    if per_user:
+        return f"{scope}:{user.pk}"
+    return scope
+
+
+def _make_list_cache_key(prefix, request, query_params, scope, generations):
+    params = "&".join(
+        f"{name}={value}"
+        for name, values in sorted(query_params.lists())
+        for value in values
+    )
+    generations = ".".join(str(g) for g in generations)
+    raw = f"{request.get_host()}{request.path}?{params}|{scope}|{generations}"
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+def build_list_cache_key(prefix, request, models, per_user=False):
+    """Ключ учитывает страницу, параметры запроса, область авторизации
+    и поколения моделей, от которых зависит ответ"""
+    scope = get_auth_scope(request, per_user=per_user)
+    return _make_list_cache_key(
+        prefix, request, request.query_params, scope, get_generations(models)
+    )
+
+
+async def abuild_list_cache_key(prefix, request, models, scope="anon"):
+    """То же для асинхронных Django-view, где нет request.query_params"""
+    generations = await aget_generations(models)
+    return _make_list_cache_key(prefix, request, request.GET, scope, generations)
+
+
+class CachedListMixin:
+    """Кэширует ответы list() до изменения любой из cache_models.
+
+    Ключ кэша служит и ETag'ом: при совпавшем If-None-Match
+    отдаётся 304 без чтения кэша и сериализации"""
+
+    cache_prefix = None
+    cache_models = ()
+    cache_timeout = None
+    cache_per_user = False
+
+    def get_list_cache_key(self, request):
+        return build_list_cache_key(
+            self.cache_prefix, request, self.cache_models, per_user=self.cache_per_user
+        )
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_list_cache_key(request)
+        etag = quote_etag(key.rsplit(":", 1)[-1])
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            record_cache(self.cache_prefix, "hit")
+            return not_modified
+
+        list_response = super().list
+        data, result = get_or_compute(
+            key,
+            lambda: list_response(request, *args, **kwargs).data,
+            self.cache_timeout or settings.LIST_CACHE_TIMEOUT,
+        )
+        record_cache(self.cache_prefix, result)
+        response = Response(data)
+        response["ETag"] = etag
+        return response
+
@@ -0,0 +1,116 @@
+import hashlib
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+
+PRECONDITION_HEADERS = ("HTTP_IF_MATCH", "HTTP_IF_UNMODIFIED_SINCE")
+
+
+class ConditionalResponse(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def make_etag(*parts):
+    raw = ":".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+class ConditionalObjectMixin:
+    """ETag/Last-Modified по версии строки (version_field).
+
+    GET с совпавшим If-None-Match получает 304 до сериализации,
+    PUT/PATCH/DELETE с устаревшим If-Match — 412"""
+
+    version_field = "updated_at"
+    conditional_object = None
+
+    def is_conditional_write(self, request):
+        return request.method not in SAFE_METHODS and any(
+            header in request.META for header in PRECONDITION_HEADERS
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_conditional_write(request):
+            return super().dispatch(request, *args, **kwargs)
+        # Проверка версии и запись в одной транзакции (см. claim_version)
+        with transaction.atomic():
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+        return response
+
+    def get_object_etag(self, obj):
+        version = getattr(obj, self.version_field)
+        return make_etag(obj._meta.label_lower, obj.pk, version.isoformat())
+
+    def get_object_last_modified(self, obj):
+        return int(getattr(obj, self.version_field).timestamp())
+
+    def get_object(self):
+        obj = super().get_object()
+        response = get_conditional_response(
+            self.request,
+            etag=self.get_object_etag(obj),
+            last_modified=self.get_object_last_modified(obj),
+        )
+        if response is not None:
+            raise ConditionalResponse(response)
+        if self.is_conditional_write(self.request):
+            self.claim_version(obj)
+        self.conditional_object = obj
+        return obj
+
+    def claim_version(self, obj):
+        """Условный UPDATE с проверенной версией в WHERE: он блокирует строку
+        до коммита, и параллельная запись с тем же If-Match не затронет
+        ни одной строки и получит 412, а не перезапишет чужие изменения"""
+        version = getattr(obj, self.version_field)
+        claimed = (
+            type(obj)
+            ._default_manager.filter(pk=obj.pk, **{self.version_field: version})
+            .update(**{self.version_field: version})
+        )
+        if not claimed:
+            raise ConditionalResponse(HttpResponse(status=412))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        obj = self.conditional_object
+        if obj is not None and request.method != "DELETE" and response.status_code < 300:
+            # Берём версию после сохранения, чтобы ответ на PUT нёс новый ETag
+            response["ETag"] = self.get_object_etag(obj)
+            response["Last-Modified"] = http_date(self.get_object_last_modified(obj))
+        return response
+
+
+class ConditionalListMixin:
+    """ETag/Last-Modified списка по версии строки, от которой он зависит:
+    get_list_version() возвращает её datetime. Совпавший If-None-Match
+    получает 304 без чтения страницы"""
+
+    def get_list_version(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        version = self.get_list_version()
+        # Страница и сортировка — в строке запроса, у каждой свой ETag
+        etag = make_etag(type(self).__name__, request.get_full_path(), version)
+        last_modified = int(version.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return response
+        response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
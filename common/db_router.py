@@ -0,0 +1,116 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PINNED_KEY = "db:pinned:{}"
+# Модель менялась в последние REPLICA_STICKY_SECONDS: реплика может отставать
+RECENT_WRITE_KEY = "db:recent_write:{label}"
+
+_read_database = ContextVar("read_database", default=None)
+_replica_down_until = {}
+
+
+class ReplicaRouter:
+    """Чтение — с реплики, выбранной view на время запроса, запись — на primary"""
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        # Объекты, прочитанные с реплики, тоже сохраняются на primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На primary и репликах одни и те же данные
+        return True
+
+
+def get_read_database():
+    return _read_database.get()
+
+
+def choose_replica():
+    """Случайная доступная реплика или None, если живых нет"""
+    now = time.monotonic()
+    aliases = [
+        alias
+        for alias in settings.REPLICA_DATABASES
+        if _replica_down_until.get(alias, 0) <= now
+    ]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            _replica_down_until[alias] = now + settings.REPLICA_RETRY_INTERVAL
+            continue
+        return alias
+    return None
+
+
+def _recent_write_key(model):
+    return RECENT_WRITE_KEY.format(label=model._meta.label_lower)
+
+
+def pin_to_primary(user):
+    cache.set(PINNED_KEY.format(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def note_write(model):
+    """Вызывается при смене поколения модели: ответы, зависящие от неё,
+    пока не читаем с реплики, чтобы не закэшировать отставшие данные"""
+    if settings.REPLICA_DATABASES:
+        cache.set(_recent_write_key(model), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user, models=()):
+    """Пользователь недавно писал — читает свои записи с primary.
+    models: от них зависит ответ в общем кэше, важна их недавняя запись"""
+    keys = [_recent_write_key(model) for model in models]
+    if user.is_authenticated:
+        keys.append(PINNED_KEY.format(user.pk))
+    return bool(keys) and bool(cache.get_many(keys))
+
+
+class ReplicaReadMixin:
+    """Для view: безопасные методы читают с реплики, после успешной записи
+    пользователь REPLICA_STICKY_SECONDS читает с primary"""
+
+    _read_database_token = None
+
+    def dispatch(self, request, *args, **kwargs):
+        # finally, а не finalize_response: при необработанном исключении
+        # DRF его не вызывает, и реплика досталась бы следующему запросу потока
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._read_database_token is not None:
+                _read_database.reset(self._read_database_token)
+                self._read_database_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS or not settings.REPLICA_DATABASES:
+            return
+        if is_pinned(request.user, getattr(self, "cache_models", ())):
+            return
+        alias = choose_replica()
+        if alias is not None:
+            self._read_database_token = _read_database.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        user = getattr(request, "user", None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+            and settings.REPLICA_DATABASES
+        ):
+            pin_to_primary(user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,152 @@
+"""Метрики Prometheus.
+
+При нескольких процессах (gunicorn, воркеры celery) задайте переменную
+окружения PROMETHEUS_MULTIPROC_DIR — общий пустой каталог, который
+очищается при деплое. Тогда каждый процесс пишет метрики в свои файлы,
+а /metrics собирает их вместе.
+"""
+
+import os
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки запроса",
+    ["method", "route", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов на HTTP-запрос",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Суммарное время SQL-запросов на HTTP-запрос",
+    ["route"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Обращения к кэшам: hit, local_hit (процессный LRU) или miss",
+    ["cache", "result"],
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Время выполнения задач celery",
+    ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+
+def record_cache(cache, result, amount=1):
+    if amount:
+        CACHE_LOOKUPS.labels(cache, result).inc(amount)
+
+
+class QueryStats:
+    """execute_wrapper: считает запросы и их время"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def get_route(request):
+    # Шаблон маршрута, а не путь: иначе каждый id — отдельная серия
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def observe(self, request, response, duration, stats=None):
+        route = get_route(request)
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+            duration
+        )
+        if stats is not None:
+            REQUEST_DB_QUERIES.labels(route).observe(stats.count)
+            REQUEST_DB_TIME.labels(route).observe(stats.duration)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        # Async ORM ходит в БД из другого потока со своими соединениями,
+        # поэтому здесь пишется только время ответа
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
+
+
+_task_started = {}
+
+
+def task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+def task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - start
+        )
+
+
+def worker_process_shutdown(pid=None, **kwargs):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,58 @@
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+
+class ConcurrencyLimitMiddleware:
+    """Сбрасывает нагрузку: при превышении MAX_IN_FLIGHT_REQUESTS
+    одновременных запросов в процессе сразу отвечает 503 с Retry-After,
+    не ставя запрос в очередь к БД"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def acquire(self):
+        limit = settings.MAX_IN_FLIGHT_REQUESTS
+        with self.lock:
+            if limit is not None and self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def overloaded(self):
+        response = JsonResponse(
+            {"detail": "Server is overloaded, try again later."}, status=503
+        )
+        response["Retry-After"] = str(settings.OVERLOAD_RETRY_AFTER)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.acquire():
+            return self.overloaded()
+        try:
+            return self.get_response(request)
+        finally:
+            self.release()
+
+    async def __acall__(self, request):
+        if not self.acquire():
+            return self.overloaded()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.release()
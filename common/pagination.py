@@ -0,0 +1,198 @@
+import base64
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+PAGE_SIZE = 5
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (id) или (price, id) без OFFSET и COUNT(*).
+
+    Порядок выбирается параметром ordering из view.keyset_orderings,
+    total считается только по запросу ?total=true"""
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "ordering"
+    total_query_param = "total"
+    invalid_cursor_message = "Invalid cursor"
+    default_orderings = {"id": ("id",)}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+
+        self.total = None
+        if request.query_params.get(self.total_query_param) in ("1", "true"):
+            self.total = queryset.count()
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = False
+        if cursor is not None:
+            values, reverse = cursor
+            queryset = queryset.filter(self.build_filter(values, reverse))
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+        rows = list(queryset.order_by(*ordering)[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("total", self.total),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return PAGE_SIZE
+        return max(1, min(page_size, settings.MAX_PAGE_SIZE))
+
+    def get_ordering(self, request, view):
+        orderings = getattr(view, "keyset_orderings", self.default_orderings)
+        name = request.query_params.get(self.ordering_query_param)
+        if name in orderings:
+            return orderings[name]
+        return next(iter(orderings.values()))
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def build_filter(self, values, reverse):
+        """(a, b) > (x, y) разворачивается в a > x OR (a = x AND b > y)"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_row_key(self, row):
+        # Страница может быть и строками values()
+        get = row.get if isinstance(row, dict) else partial(getattr, row)
+        return [str(get(field.lstrip("-"))) for field in self.ordering]
+
+    def encode_cursor(self, row, reverse):
+        payload = json.dumps({"k": self.get_row_key(row), "r": reverse})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """Значения курсора приводятся к типам полей сортировки: курсор
+        приходит от клиента и не должен превращаться в 500"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = payload["k"], bool(payload["r"])
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError("Cursor key does not match ordering")
+            values = [
+                self.to_python(model, field.lstrip("-"), value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def to_python(model, name, value):
+        if value is None:
+            raise ValueError("Cursor values cannot be null")
+        field = model._meta.get_field(name)
+        value = field.to_python(value)
+        # Валидаторы поля отсекают, например, id вне диапазона INTEGER
+        field.run_validators(value)
+        return value
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация; с ?pagination=cursor, ?cursor=... или
+    pagination_mode = "cursor" у view переключается на KeysetPagination"""
+
+    mode_query_param = "pagination"
+    keyset = None
+
+    def use_keyset(self, request, view):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            return True
+        mode = request.query_params.get(self.mode_query_param)
+        if mode is None:
+            mode = getattr(view, "pagination_mode", "page")
+        return mode == "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request, view):
+            # keyset_orderings = None: порядок задаёт сам queryset (например,
+            # ранг поиска), и курсор по полям модели его бы потерял
+            if getattr(view, "keyset_orderings", ()) is None:
+                raise ValidationError(
+                    {self.mode_query_param: "Cursor pagination is not supported here."}
+                )
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("total", self.page.paginator.count),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_page_size(self, request):
+        return PAGE_SIZE
@@ -8,7 +8,7 @@ class IsOwner(BasePermission):
         return request.user.is_authenticated and not request.user.is_staff
 
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        return obj.owner_id == request.user.pk
 
 
 class IsAnonymousReadOnly(BasePermission):
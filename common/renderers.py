@@ -0,0 +1,84 @@
+import re
+
+import orjson
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+FRAGMENT_MARK = "\x00fragment:%d\x00"
+# json экранирует управляющие символы, в готовом ответе метка выглядит так
+FRAGMENT_MARK_RE = re.compile(rb'"\\u0000fragment:(\d+)\\u0000"')
+
+
+class Fragment:
+    """Готовый JSON объекта, который вставляется в ответ как есть"""
+
+    __slots__ = ("json",)
+
+    def __init__(self, json):
+        self.json = json
+
+    def __getstate__(self):
+        return self.json
+
+    def __setstate__(self, state):
+        self.json = state
+
+
+def _replace_fragments(value, fragments):
+    if isinstance(value, Fragment):
+        fragments.append(value.json)
+        return FRAGMENT_MARK % (len(fragments) - 1)
+    if isinstance(value, dict):
+        return {key: _replace_fragments(item, fragments) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_replace_fragments(item, fragments) for item in value]
+    return value
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """JSONRenderer, который вклеивает Fragment байтами, не сериализуя заново"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        fragments = []
+        data = _replace_fragments(data, fragments)
+        content = self.dumps(data, accepted_media_type, renderer_context)
+        if not fragments:
+            return content
+        return FRAGMENT_MARK_RE.sub(lambda match: fragments[int(match[1])], content)
+
+    def dumps(self, data, accepted_media_type, renderer_context):
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class ORJSONRenderer(FragmentJSONRenderer):
+    """Тот же JSON, что у JSONRenderer, байт в байт, но через orjson.
+
+    Даты и прочие нестандартные типы отдаются кодировщику DRF, чтобы формат
+    совпадал. Отличие одно: float с экспонентой orjson пишет как 1e16, а не
+    1e+16 — в ответах магазина таких чисел нет"""
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(self, data, accepted_media_type, renderer_context):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if data is None or indent or self.ensure_ascii or not self.compact:
+            return super().dumps(data, accepted_media_type, renderer_context)
+        default = self.encoder_class().default
+        content = orjson.dumps(data, default=default, option=self.options)
+        # JSONRenderer экранирует разделители строк, недопустимые в JavaScript
+        return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class FastRendererMixin:
+    """Для view: при FAST_READ_PATH JSON отдаёт ORJSONRenderer"""
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not settings.FAST_READ_PATH:
+            return renderers
+        return [
+            ORJSONRenderer() if isinstance(renderer, JSONRenderer) else renderer
+            for renderer in renderers
+        ]
@@ -0,0 +1,120 @@
+"""Проверка бюджета SQL-запросов в тестах.
+
+QueryRecorder записывает запросы вместе с местом, откуда они пришли:
+полем сериализатора, если запрос сделан при сериализации, иначе
+строкой кода проекта. Повтор одного и того же запроса с разными
+параметрами — признак N+1.
+"""
+
+import re
+import sys
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import Serializer
+
+_SQL_IN_LIST = re.compile(r"\((?:\s*%s\s*,)*\s*%s\s*\)")
+_SQL_NUMBER = re.compile(r"\b\d+\b")
+_SQL_SAVEPOINT = re.compile(r'^(?:RELEASE )?SAVEPOINT|^ROLLBACK TO SAVEPOINT')
+
+
+def sql_shape(sql):
+    """Запрос без значений: IN-списки и числа (LIMIT/OFFSET) сворачиваются"""
+    return _SQL_NUMBER.sub("N", _SQL_IN_LIST.sub("(...)", sql))
+
+
+def find_origin():
+    """Поле сериализатора или строка кода проекта, вызвавшая запрос"""
+    frame = sys._getframe(2)
+    location = None
+    while frame is not None:
+        field = frame.f_locals.get("field")
+        owner = frame.f_locals.get("self")
+        if (
+            frame.f_code.co_name == "to_representation"
+            and isinstance(owner, Serializer)
+            and getattr(field, "field_name", None)
+        ):
+            return f"{type(owner).__name__}.{field.field_name}"
+        path = frame.f_code.co_filename
+        if location is None and _is_project_file(path):
+            location = f"{path}:{frame.f_lineno}"
+        frame = frame.f_back
+    return location or "unknown"
+
+
+def _is_project_file(path):
+    path = Path(path)
+    return (
+        Path(settings.BASE_DIR) in path.parents
+        and "site-packages" not in path.parts
+        and path.name != "testing.py"
+    )
+
+
+class QueryRecorder:
+    """Контекстный менеджер: запросы ко всем БД с происхождением"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not _SQL_SAVEPOINT.match(sql):
+            self.queries.append((sql_shape(sql), find_origin()))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self):
+        """{форма запроса: (число повторов, места вызова)} для повторов"""
+        counts = Counter(shape for shape, _ in self.queries)
+        origins = defaultdict(set)
+        for shape, origin in self.queries:
+            origins[shape].add(origin)
+        return {
+            shape: (count, sorted(origins[shape]))
+            for shape, count in counts.items()
+            if count > 1
+        }
+
+    def report(self):
+        lines = [f"{len(self.queries)} queries:"]
+        lines += [f"  [{origin}] {shape}" for shape, origin in self.queries]
+        return "\n".join(lines)
+
+
+class QueryBudgetMixin:
+    """Для TestCase: assertQueryBudget падает, если запросов больше
+    бюджета или один запрос повторяется (N+1)"""
+
+    def assertQueryBudget(self, budget, func, *args, allow_repeats=0, **kwargs):
+        with QueryRecorder() as recorder:
+            result = func(*args, **kwargs)
+
+        repeated = {
+            shape: info
+            for shape, info in recorder.repeated().items()
+            if info[0] > allow_repeats + 1
+        }
+        if repeated:
+            details = "\n".join(
+                f"  {count}x from {', '.join(origins)}: {shape}"
+                for shape, (count, origins) in repeated.items()
+            )
+            self.fail(f"Repeated queries (N+1?):\n{details}\n{recorder.report()}")
+        if len(recorder) > budget:
+            self.fail(f"Query budget {budget} exceeded:\n{recorder.report()}")
+        return result
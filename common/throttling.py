@@ -0,0 +1,146 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from common.cache import get_redis
+
+# Пополнение и списание токена одной атомарной операцией;
+# время берётся у Redis, чтобы часы воркеров не влияли на лимит.
+# Возвращает, сколько секунд ждать до следующего токена (0 — пропускаем)
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+# Сколько секунд не ходить в Redis после ошибки соединения
+REDIS_RETRY_INTERVAL = 5
+
+
+class LocalTokenBuckets:
+    """Token bucket в памяти процесса: запасной вариант, пока Redis недоступен"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, ts = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+local_buckets = LocalTokenBuckets()
+_redis_down_until = 0.0
+
+
+@receiver(setting_changed)
+def reset_local_buckets(setting=None, **kwargs):
+    global _redis_down_until
+    if setting in ("REST_FRAMEWORK", "CACHES"):
+        local_buckets.clear()
+        _redis_down_until = 0.0
+
+
+def consume_token(key, capacity, rate):
+    """Списывает токен из корзины key, возвращает время ожидания в секундах"""
+    global _redis_down_until
+    redis = get_redis() if time.monotonic() >= _redis_down_until else None
+    if redis is not None:
+        try:
+            return float(redis.eval(TOKEN_BUCKET_SCRIPT, 1, key, capacity, rate))
+        except RedisError:
+            _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+    return local_buckets.consume(key, capacity, rate)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Лимит запросов по token bucket.
+
+    Скоуп задаётся во view через throttle_scope (по умолчанию "default"),
+    лимит — в DEFAULT_THROTTLE_RATES; для анонимов сначала ищется
+    "<scope>_anon". Ключ — пользователь, токен или IP: throttle_ident во view
+    ("user", "token", "ip"), по умолчанию пользователь, а для анонимов IP.
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    def __init__(self):
+        # Скоуп и лимит известны только в allow_request
+        self.wait_seconds = None
+
+    def get_rate(self):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        if self.anonymous and f"{self.scope}_anon" in rates:
+            return rates[f"{self.scope}_anon"]
+        return rates.get(self.scope)
+
+    def get_ident_for(self, request, view):
+        mode = getattr(view, "throttle_ident", None)
+        if mode is None:
+            mode = "ip" if self.anonymous else "user"
+        if mode == "token" and request.auth is not None:
+            return "token:" + hashlib.sha1(str(request.auth).encode()).hexdigest()
+        if mode in ("user", "token") and not self.anonymous:
+            return f"user:{request.user.pk}"
+        return "ip:" + self.get_ident(request)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident_for(request, view),
+        }
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, "throttle_scope", "default")
+        self.anonymous = not (request.user and request.user.is_authenticated)
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.wait_seconds = consume_token(
+            self.get_cache_key(request, view),
+            self.num_requests,
+            self.num_requests / self.duration,
+        )
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(using, **kwargs):
+    from django.db import connections
+
+    from .models import Product
+    from .search import ensure_search_index
+
+    connection = connections[using]
+    # Таблицы товаров может ещё не быть, если миграции приложения не созданы
+    if Product._meta.db_table in connection.introspection.table_names():
+        ensure_search_index(connection)
 
 
 class ProductConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "product"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(create_search_index, sender=self)
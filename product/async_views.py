@@ -0,0 +1,145 @@
+"""Асинхронные read-only варианты товарных эндпоинтов для ASGI.
+
+Запросы к БД идут через async ORM, сериализация работает по уже
+загруженным объектам. Async ORM Django и aget/aset django_redis — обёртки
+sync_to_async: ввод-вывод уходит в пул потоков, цикл событий не блокируется,
+но работы на запрос не меньше, чем у синхронных view.
+
+Контракт уже, чем у синхронных списков: фильтры и фасеты те же
+(filter_products, get_product_facets), пагинация только постраничная —
+курсор (?cursor, ?pagination=cursor) отклоняется с 400"""
+
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from users.authentication import CachedJWTAuthentication
+
+from common.cache import abuild_list_cache_key
+from common.metrics import record_cache
+from common.pagination import PAGE_SIZE, CustomPagination, KeysetPagination
+from .filters import facets_requested, filter_products, get_product_facets
+from .models import Category, Product, Review
+from .reviews import DEFAULT_REVIEW_SORT, REVIEW_SORTS, top_reviews_prefetch
+from .serializers import ProductSerializer, ProductWithReviewsSerializer
+from .views import PRODUCT_KEYSET_ORDERINGS
+
+
+def _get_page_number(request):
+    try:
+        return max(1, int(request.GET.get("page", 1)))
+    except ValueError:
+        return 1
+
+
+def _page_link(request, page):
+    url = request.build_absolute_uri()
+    if page == 1:
+        return remove_query_param(url, "page")
+    return replace_query_param(url, "page", page)
+
+
+async def _paginated(request, queryset, serializer_class):
+    page = _get_page_number(request)
+    total = await queryset.acount()
+    offset = (page - 1) * PAGE_SIZE
+    if page > 1 and offset >= total:
+        return None
+    rows = [row async for row in queryset[offset : offset + PAGE_SIZE]]
+    return OrderedDict(
+        [
+            ("total", total),
+            ("next", _page_link(request, page + 1) if offset + PAGE_SIZE < total else None),
+            ("previous", _page_link(request, page - 1) if page > 1 else None),
+            ("results", serializer_class(rows, many=True).data),
+        ]
+    )
+
+
+def _is_cursor_request(request):
+    return (
+        KeysetPagination.cursor_query_param in request.GET
+        or request.GET.get(CustomPagination.mode_query_param) == "cursor"
+    )
+
+
+async def _cached_list(request, prefix, queryset, serializer_class, facets=False):
+    if _is_cursor_request(request):
+        return JsonResponse(
+            {"detail": "Cursor pagination is not supported here."}, status=400
+        )
+    key = await abuild_list_cache_key(prefix, request, (Product, Category, Review))
+    data = await cache.aget(key)
+    record_cache(prefix, "miss" if data is None else "hit")
+    if data is None:
+        data = await _paginated(request, queryset, serializer_class)
+        if data is None:
+            return JsonResponse({"detail": "Invalid page."}, status=404)
+        if facets:
+            first_page = _get_page_number(request) == 1
+            data["facets"] = None
+            if facets_requested(request.GET, first_page):
+                data["facets"] = await sync_to_async(get_product_facets)(queryset)
+        await cache.aset(key, data, timeout=settings.LIST_CACHE_TIMEOUT)
+    return JsonResponse(data)
+
+
+@require_GET
+async def product_list(request):
+    try:
+        queryset = filter_products(
+            Product.objects.select_related("category"),
+            request.GET,
+            PRODUCT_KEYSET_ORDERINGS,
+        )
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=400)
+    return await _cached_list(
+        request, "async_product_list", queryset, ProductSerializer, facets=True
+    )
+
+
+@require_GET
+async def product_with_reviews_list(request):
+    sort = request.GET.get("reviews_sort")
+    queryset = (
+        Product.objects.select_related("category")
+        .prefetch_related(
+            top_reviews_prefetch(sort if sort in REVIEW_SORTS else DEFAULT_REVIEW_SORT)
+        )
+        .order_by("id")
+    )
+    return await _cached_list(
+        request, "async_product_reviews_list", queryset, ProductWithReviewsSerializer
+    )
+
+
+@require_GET
+async def product_detail(request, id):
+    # Те же правила, что у IsOwner | IsStaff в ProductDetailAPIView
+    try:
+        auth = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as exc:
+        detail = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+        return JsonResponse(detail, status=401)
+    if auth is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+    user = auth[0]
+
+    try:
+        product = await Product.objects.select_related("category").aget(id=id)
+    except Product.DoesNotExist:
+        return JsonResponse({"detail": "No Product matches the given query."}, status=404)
+    if not user.is_staff and product.owner_id != user.id:
+        return JsonResponse(
+            {"detail": "You do not have permission to perform this action."},
+            status=403,
+        )
+    return JsonResponse(ProductSerializer(product).data)
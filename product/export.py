@@ -0,0 +1,71 @@
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Product
+
+EXPORT_FIELDS = [
+    "id",
+    "title",
+    "description",
+    "price",
+    "category_id",
+    "category__name",
+    "owner_id",
+    "rating_sum",
+    "rating_count",
+    "updated_at",
+]
+EXPORT_HEADER = [
+    "id",
+    "title",
+    "description",
+    "price",
+    "category_id",
+    "category",
+    "owner_id",
+    "rating",
+    "rating_count",
+    "updated_at",
+]
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(updated_since=None, using=None):
+    queryset = Product.objects.using(using).order_by("id")
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    for row in rows:
+        row = list(row)
+        rating_sum, rating_count = row[7], row[8]
+        row[7] = round(rating_sum / rating_count, 2) if rating_count else None
+        yield row
+
+
+def iter_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_HEADER, row))) + "\n"
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+    "csv": (iter_csv, "text/csv"),
+}
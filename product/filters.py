@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db.models import Count, F, Q
+from rest_framework.filters import BaseFilterBackend
+
+from .serializers import ProductFilterValidateSerializer
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """Фильтры category, price_min/price_max, min_rating и ordering"""
+
+    def filter_queryset(self, request, queryset, view):
+        orderings = getattr(view, "keyset_orderings", {})
+        return filter_products(queryset, request.query_params, orderings)
+
+
+def filter_products(queryset, query_params, orderings):
+    """Общая часть фильтров для DRF-view и асинхронных view"""
+    serializer = ProductFilterValidateSerializer(data=query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+
+    if "category" in params:
+        queryset = queryset.filter(category_id=params["category"])
+    if "price_min" in params:
+        queryset = queryset.filter(price__gte=params["price_min"])
+    if "price_max" in params:
+        queryset = queryset.filter(price__lte=params["price_max"])
+    if "min_rating" in params:
+        # rating_sum / rating_count >= min_rating без деления в SQL
+        queryset = queryset.filter(
+            rating_count__gt=0,
+            rating_sum__gte=F("rating_count") * params["min_rating"],
+        )
+
+    ordering = orderings.get(params.get("ordering"))
+    return queryset.order_by(*(ordering or ("id",)))
+
+
+def facets_requested(query_params, first_page):
+    """Фасеты не зависят от страницы: считаем их для первой страницы
+    или по явному ?facets=1, а не двумя агрегатами на каждую"""
+    if "facets" in query_params:
+        return query_params["facets"] in ("1", "true")
+    return first_page
+
+
+def get_price_buckets():
+    bounds = settings.PRICE_FACET_BOUNDS
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def get_product_facets(queryset):
+    """Считает фасеты двумя сгруппированными запросами"""
+    queryset = queryset.order_by()
+    categories = (
+        queryset.values("category_id", "category__name")
+        .annotate(count=Count("id"))
+        .order_by("category_id")
+    )
+
+    buckets = get_price_buckets()
+    aggregates = {}
+    for index, (low, high) in enumerate(buckets):
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f"bucket_{index}"] = Count("id", filter=condition)
+    counts = queryset.aggregate(**aggregates)
+
+    return {
+        "category": [
+            {"id": row["category_id"], "name": row["category__name"], "count": row["count"]}
+            for row in categories
+        ],
+        "price": [
+            {"min": low, "max": high, "count": counts[f"bucket_{index}"]}
+            for index, (low, high) in enumerate(buckets)
+        ],
+    }
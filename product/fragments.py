@@ -0,0 +1,189 @@
+"""Кэш готового JSON отдельных товаров.
+
+Ключ — id товара и версия (updated_at товара, для вложенной категории —
+и её updated_at), поэтому изменение сразу даёт новый ключ, а старые
+фрагменты просто истекают. Списки выбирают со страницы только id и версии,
+забирают фрагменты одним get_many и сериализуют лишь промахи. Задача
+rebuild_product_fragments заранее прогревает фрагменты изменённых товаров.
+"""
+
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+
+from common.cache import get_redis
+from common.metrics import record_cache
+from common.renderers import (
+    FastRendererMixin,
+    Fragment,
+    FragmentJSONRenderer,
+    ORJSONRenderer,
+)
+
+from .models import Product
+from .reviews import REVIEW_SORTS, top_reviews_prefetch
+from .rows import PRODUCT_ROWS, product_with_reviews_rows
+from .serializers import ProductSerializer, ProductWithReviewsSerializer
+
+FRAGMENT_KEY = "fragment:{name}:{id}:{version}"
+DIRTY_KEY = "fragments:dirty"
+
+
+def product_id(product):
+    return product["id"] if isinstance(product, dict) else product.pk
+
+
+class FragmentSpec:
+    """Фрагмент товара: сериализатор, а при FAST_READ_PATH — rows,
+    функция queryset -> строки того же формата (см. product.rows)"""
+
+    def __init__(self, name, serializer_class, queryset, version_fields, rows):
+        self.name = name
+        self.serializer_class = serializer_class
+        self.queryset = queryset
+        self.version_fields = version_fields
+        self.rows = rows
+
+    def version(self, product):
+        """product — объект или строка values(*PAGE_FIELDS)"""
+        parts = []
+        for path in self.version_fields:
+            if isinstance(product, dict):
+                value = product[path]
+            else:
+                value = product
+                for attr in path.split("__"):
+                    value = getattr(value, attr)
+            parts.append(str(int(value.timestamp() * 1_000_000)))
+        return "-".join(parts)
+
+    def key(self, product):
+        return FRAGMENT_KEY.format(
+            name=self.name, id=product_id(product), version=self.version(product)
+        )
+
+    def render(self, ids):
+        """{id: Fragment} для существующих товаров из ids"""
+        if settings.FAST_READ_PATH:
+            rows = self.rows(Product.objects.filter(pk__in=ids).order_by())
+            # Строки без Fragment внутри: обход render() не нужен
+            renderer = ORJSONRenderer()
+            return {row["id"]: Fragment(renderer.dumps(row, None, {})) for row in rows}
+        renderer = JSONRenderer()
+        products = self.queryset.filter(pk__in=ids).order_by()
+        data = self.serializer_class(products, many=True).data
+        return {item["id"]: Fragment(renderer.render(item)) for item in data}
+
+
+FRAGMENTS = {
+    "product": FragmentSpec(
+        "product",
+        ProductSerializer,
+        Product.objects.all(),
+        ("updated_at",),
+        PRODUCT_ROWS.rows,
+    ),
+    **{
+        f"product_with_{sort}_reviews": FragmentSpec(
+            f"product_with_{sort}_reviews",
+            ProductWithReviewsSerializer,
+            Product.objects.select_related("category").prefetch_related(
+                top_reviews_prefetch(sort)
+            ),
+            ("updated_at", "category__updated_at"),
+            partial(product_with_reviews_rows, sort=sort),
+        )
+        for sort in REVIEW_SORTS
+    },
+}
+# Поля страницы: id, версия и поля сортировки keyset-пагинации
+PAGE_FIELDS = ("id", "price", "updated_at", "category", "category__updated_at")
+
+
+def get_fragments(spec, products):
+    """Фрагменты для товаров страницы в их порядке; промахи сериализуются"""
+    keys = {product_id(product): spec.key(product) for product in products}
+    found = cache.get_many(list(keys.values()))
+    missing = [pk for pk, key in keys.items() if key not in found]
+    record_cache(f"fragment:{spec.name}", "hit", len(found))
+    record_cache(f"fragment:{spec.name}", "miss", len(missing))
+    if missing:
+        rendered = cache_fragments(spec, keys, spec.render(missing))
+        found.update(rendered)
+    # Удалённые между запросами товары пропускаем
+    return [found[key] for key in keys.values() if key in found]
+
+
+def cache_fragments(spec, keys, fragments):
+    """Кладёт {id: Fragment} в кэш под ключами keys, посчитанными до рендера:
+    данные фрагмента не старше версии в ключе, новая версия даст новый ключ"""
+    rendered = {keys[pk]: fragment for pk, fragment in fragments.items() if pk in keys}
+    cache.set_many(rendered, timeout=settings.FRAGMENT_CACHE_TIMEOUT)
+    return rendered
+
+
+class FragmentListMixin(FastRendererMixin):
+    """Для списков товаров: результаты собираются из кэша фрагментов.
+    fragment — имя из FRAGMENTS"""
+
+    fragment = "product"
+    renderer_classes = [FragmentJSONRenderer, BrowsableAPIRenderer]
+
+    def get_fragment_spec(self):
+        return FRAGMENTS[self.fragment]
+
+    def list(self, request, *args, **kwargs):
+        spec = self.get_fragment_spec()
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .select_related("category")
+            .prefetch_related(None)
+            .only(*PAGE_FIELDS)
+        )
+        if settings.FAST_READ_PATH:
+            # Для ключей фрагментов хватает строк, объекты не нужны
+            queryset = queryset.values(*PAGE_FIELDS)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(get_fragments(spec, page))
+        return Response(get_fragments(spec, list(queryset)))
+
+
+def mark_dirty(product_ids=(), category_ids=()):
+    """Ставит фрагменты в очередь на прогрев после коммита.
+    Без Redis очереди нет: фрагменты заполнятся при чтении"""
+    members = [f"p:{pk}" for pk in product_ids] + [f"c:{pk}" for pk in category_ids]
+    redis = get_redis()
+    if redis is None or not members:
+        return
+    transaction.on_commit(lambda: redis.sadd(DIRTY_KEY, *members))
+
+
+def take_dirty(batch_size):
+    redis = get_redis()
+    if redis is None:
+        return [], []
+    product_ids, category_ids = [], []
+    for member in redis.spop(DIRTY_KEY, batch_size) or []:
+        kind, pk = member.decode().split(":")
+        (product_ids if kind == "p" else category_ids).append(int(pk))
+    return product_ids, category_ids
+
+
+def warm_fragments(product_ids=(), category_ids=(), batch_size=500):
+    """Рендерит и кладёт в кэш фрагменты товаров и товаров категорий"""
+    condition = Q(pk__in=product_ids) | Q(category_id__in=category_ids)
+    ids = list(Product.objects.filter(condition).values_list("pk", flat=True))
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start : start + batch_size]
+        products = Product.objects.filter(pk__in=batch).select_related("category")
+        products = list(products.only(*PAGE_FIELDS))
+        for spec in FRAGMENTS.values():
+            keys = {product.pk: spec.key(product) for product in products}
+            cache_fragments(spec, keys, spec.render(batch))
+    return len(ids)
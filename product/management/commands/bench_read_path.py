@@ -0,0 +1,97 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+ROUTES = [
+    ("/api/v1/products/", "/api/v1/products/async/"),
+    ("/api/v1/products/reviews/", "/api/v1/products/async/reviews/"),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Сравнивает синхронный (WSGI) и асинхронный (ASGI) путь чтения товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Размер пула потоков для WSGI, как у воркера",
+        )
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        # Как в bench_routes: лимиты и сброс нагрузки исказили бы замер ответами 429/503
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}}
+        failed = 0
+        with override_settings(
+            REST_FRAMEWORK=rest_framework, MAX_IN_FLIGHT_REQUESTS=None
+        ):
+            for sync_path, async_path in ROUTES:
+                elapsed, latencies, errors = self.run_sync(
+                    sync_path, total, options["threads"]
+                )
+                self.report("wsgi", sync_path, total, elapsed, latencies, errors)
+                failed += len(errors)
+                elapsed, latencies, errors = asyncio.run(
+                    self.run_async(async_path, total, options["concurrency"])
+                )
+                self.report("asgi", async_path, total, elapsed, latencies, errors)
+                failed += len(errors)
+        if failed:
+            raise CommandError(f"Неуспешных ответов: {failed}, замер недостоверен")
+
+    def run_sync(self, path, total, threads):
+        client = Client()
+        errors = []
+
+        def call(_):
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+            if not 200 <= response.status_code < 300:
+                errors.append(response.status_code)
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(call, range(total)))
+        return time.perf_counter() - started, latencies, errors
+
+    async def run_async(self, path, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        errors = []
+
+        async def call():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                elapsed = time.perf_counter() - started
+                if not 200 <= response.status_code < 300:
+                    errors.append(response.status_code)
+                return elapsed
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(call() for _ in range(total)))
+        return time.perf_counter() - started, latencies, errors
+
+    def report(self, mode, path, total, elapsed, latencies, errors):
+        self.stdout.write(
+            f"{mode:<5} {path:<36} {total / elapsed:8.1f} req/s  "
+            f"p50={statistics.median(latencies) * 1000:.1f}ms  "
+            f"p95={percentile(latencies, 0.95) * 1000:.1f}ms  "
+            f"errors={len(errors)} {sorted(set(errors)) if errors else ''}".rstrip()
+        )
@@ -0,0 +1,272 @@
+import json
+import platform
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.test import override_settings
+from django.urls import URLPattern
+from django.utils import timezone as django_timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from product import urls as product_urls
+from product.management.commands.bench_read_path import percentile
+from product.management.commands.seed_shop import SEED_PASSWORD
+from product.models import Category, Product, Review
+from shop_api.celery import app as celery_app
+from users import urls as users_urls
+from users.models import CustomUser, store_verification_code
+from users.tokens import CachedRefreshToken
+
+PREFIXES = ((product_urls, "/api/v1/products/"), (users_urls, "/api/v1/users/"))
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+# Внешний провайдер в бенчмарк не входит
+SKIPPED_ROUTES = {"google-login/": "ходит в Google"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет задержки и пропускную способность всех маршрутов товаров "
+        "и пользователей на данных seed_shop, пишет результат в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--threads", type=int, default=1)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--password", default=SEED_PASSWORD)
+        parser.add_argument("--output", default="bench.json")
+        parser.add_argument(
+            "--route", action="append", help="Только указанные маршруты, например search/"
+        )
+
+    def handle(self, *args, **options):
+        self.password = options["password"]
+        self.prepare_fixtures()
+        specs = self.get_specs()
+        unknown = [route for route, _ in self.iter_routes() if route not in specs]
+        if unknown:
+            raise CommandError(f"Нет сценария для маршрутов: {', '.join(unknown)}")
+
+        # Redis заменяем локальным кэшем, письма — памятью, лимиты отключаем
+        # (throttle_classes view читают при импорте, поэтому обнуляем сами лимиты)
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}}
+        celery_app.conf.task_always_eager = True
+        results = []
+        # Набор данных считаем до замера: записывающие маршруты его меняют
+        meta = self.get_meta(options)
+        self.mark_watermarks()
+        try:
+            with override_settings(
+                CACHES=LOCAL_CACHES,
+                REST_FRAMEWORK=rest_framework,
+                MAX_IN_FLIGHT_REQUESTS=None,
+                EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            ):
+                for route, path in self.iter_routes():
+                    if options["route"] and route not in options["route"]:
+                        continue
+                    if route in SKIPPED_ROUTES:
+                        self.stdout.write(f"skip  {path:<40} {SKIPPED_ROUTES[route]}")
+                        continue
+                    result = self.run(path, specs[route], options)
+                    self.report(result)
+                    results.append(result)
+        finally:
+            self.delete_created()
+
+        with open(options["output"], "w") as output:
+            json.dump({"meta": meta, "routes": results}, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
+
+    def iter_routes(self):
+        for module, prefix in PREFIXES:
+            for pattern in module.urlpatterns:
+                if isinstance(pattern, URLPattern):
+                    yield str(pattern.pattern), prefix + str(pattern.pattern)
+
+    def prepare_fixtures(self):
+        product = Product.objects.order_by("id").first()
+        if product is None:
+            raise CommandError("База пуста, сначала запустите seed_shop")
+        self.product = product
+        self.owner = CustomUser.objects.get(id=product.owner_id)
+        self.category_id = product.category_id
+        self.admin, _ = CustomUser.objects.get_or_create(
+            email="bench-admin@example.com",
+            defaults={"username": "bench-admin", "is_staff": True, "is_superuser": True},
+        )
+
+    def mark_watermarks(self):
+        """Запоминает последние id до замера, чтобы удалить созданное им.
+        Откат транзакции не подходит: потоки пишут через свои соединения"""
+        self.started_at = django_timezone.now()
+        self.watermarks = {
+            model: model.objects.aggregate(last=Max("id"))["last"] or 0
+            for model in (Product, CustomUser, OutstandingToken)
+        }
+
+    def delete_created(self):
+        """Удаляет товары bulk/, пользователей registration/ и выпущенные
+        токены. delete() шлёт сигналы, так что счётчики категорий сходятся"""
+        created = {
+            "products": Product.objects.filter(
+                id__gt=self.watermarks[Product], owner=self.owner
+            ),
+            # Вместе с ними каскадом удаляются их токены
+            "users": CustomUser.objects.filter(
+                id__gt=self.watermarks[CustomUser], email__startswith="bench-"
+            ),
+            "refresh tokens": OutstandingToken.objects.filter(
+                id__gt=self.watermarks[OutstandingToken]
+            ),
+            "auth tokens": Token.objects.filter(
+                user=self.owner, created__gte=self.started_at
+            ),
+        }
+        for name, queryset in created.items():
+            _, deleted = queryset.delete()
+            count = deleted.get(queryset.model._meta.label, 0)
+            if count:
+                self.stdout.write(f"Удалено ({name}): {count}")
+
+    def auth(self, user):
+        return {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+
+    def get_specs(self):
+        """Маршрут -> (метод, функция, возвращающая (путь-суффикс, данные, заголовки))"""
+        product_id = self.product.id
+        # Токены выпускаются на каждый запрос, чтобы не истекали посреди замера
+        owner = lambda: self.auth(self.owner)  # noqa: E731
+        admin = lambda: self.auth(self.admin)  # noqa: E731
+
+        def product_data():
+            return {
+                "title": f"Бенч {uuid.uuid4().hex[:8]}",
+                "price": 10,
+                "category": self.category_id,
+            }
+
+        def registration():
+            name = uuid.uuid4().hex[:12]
+            return {
+                "email": f"bench-{name}@example.com",
+                "username": f"bench-{name}",
+                "birthday": "1990-01-01",
+                "password": self.password,
+            }
+
+        def confirmation():
+            code = store_verification_code(self.owner.id, "bench")
+            return {"user_id": self.owner.id, "code": code}
+
+        def refresh():
+            return {"refresh": str(CachedRefreshToken.for_user(self.owner))}
+
+        credentials = {"email": self.owner.email, "password": self.password}
+        return {
+            "": ("get", lambda: ("", None, {})),
+            "<int:id>/": ("get", lambda: (product_id, None, owner())),
+            "<int:id>/reviews/": ("get", lambda: (product_id, None, {})),
+            "categories/": ("get", lambda: ("", None, {})),
+            "categories/<int:id>/": ("get", lambda: (self.category_id, None, admin())),
+            "reviews/": ("get", lambda: ("", None, {})),
+            "my/": ("get", lambda: ("", None, owner())),
+            "search/": ("get", lambda: ("?q=чайник", None, {})),
+            "bulk/": ("post", lambda: ("", [product_data() for _ in range(10)], owner())),
+            "export/": ("get", lambda: ("", None, {})),
+            "async/": ("get", lambda: ("", None, {})),
+            "async/<int:id>/": ("get", lambda: (product_id, None, owner())),
+            "async/reviews/": ("get", lambda: ("", None, {})),
+            "registration/": ("post", lambda: ("", registration(), {})),
+            "authorization/": ("post", lambda: ("", credentials, {})),
+            "confirm/": ("post", lambda: ("", confirmation(), {})),
+            "token/": ("post", lambda: ("", credentials, {})),
+            "token/refresh/": ("post", lambda: ("", refresh(), {})),
+            "google-login/": ("post", lambda: ("", {}, {})),
+        }
+
+    def run(self, path, spec, options):
+        method, make_request = spec
+        template = path.replace("<int:id>/", "{}/")
+        # Ошибки (например, блокировка SQLite при записи из потоков) считаем как 500
+        client = APIClient(raise_request_exception=False)
+        errors = []
+
+        def call(_):
+            suffix, data, headers = make_request()
+            url = template.format(suffix) if "{}" in template else template + suffix
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data, format="json", **headers)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            return elapsed
+
+        for i in range(options["warmup"]):
+            call(i)
+        errors.clear()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            latencies = list(pool.map(call, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+
+        return {
+            "route": path,
+            "method": method.upper(),
+            "requests": len(latencies),
+            "errors": len(errors),
+            "error_statuses": sorted(set(errors)),
+            "throughput": round(len(latencies) / elapsed, 1),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            **{
+                f"p{int(q * 100)}_ms": round(percentile(latencies, q) * 1000, 2)
+                for q in (0.5, 0.9, 0.95, 0.99)
+            },
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['method']:<5} {result['route']:<40} "
+            f"{result['throughput']:8.1f} req/s  p50={result['p50_ms']:.1f}ms  "
+            f"p95={result['p95_ms']:.1f}ms  p99={result['p99_ms']:.1f}ms"
+            + (f"  errors={result['errors']}" if result["errors"] else "")
+        )
+
+    def get_meta(self, options):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except OSError:
+            commit = ""
+        return {
+            "commit": commit or None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": settings.DATABASES["default"]["ENGINE"],
+            "requests": options["requests"],
+            "threads": options["threads"],
+            "dataset": {
+                "users": CustomUser.objects.count(),
+                "categories": Category.objects.count(),
+                "products": Product.objects.count(),
+                "reviews": Review.objects.count(),
+            },
+        }
@@ -0,0 +1,34 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from common.cache import bump_generation
+from product.fragments import mark_dirty
+from product.models import Category
+
+
+class Command(BaseCommand):
+    help = "Исправляет расхождения счётчика товаров в категориях"
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        with transaction.atomic():
+            drifted = list(
+                Category.objects.annotate(actual=Count("product")).exclude(
+                    products_count=F("actual")
+                )
+            )
+            for category in drifted:
+                category.products_count = category.actual
+                # Счётчик вложен во фрагменты товаров категории
+                category.updated_at = now
+            Category.objects.bulk_update(drifted, ["products_count", "updated_at"])
+            # bulk_update не шлёт сигналов: кэш списков сбрасываем сами
+            if drifted:
+                transaction.on_commit(partial(bump_generation, Category))
+                mark_dirty(category_ids=[category.pk for category in drifted])
+
+        self.stdout.write(self.style.SUCCESS(f"Исправлено категорий: {len(drifted)}"))
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from common.cache import bump_generation
+from product.fragments import mark_dirty
+from product.models import RATING_FIELDS, Product, Review
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты рейтинга товаров по отзывам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        histograms = defaultdict(dict)
+        rows = (
+            Review.objects.order_by()
+            .values_list("product_id", "stars")
+            .annotate(total=Count("id"))
+        )
+        for product_id, stars, total in rows:
+            histograms[product_id][stars] = total
+
+        updated = []
+        now = timezone.now()
+        with transaction.atomic():
+            for product in Product.objects.only("id", *RATING_FIELDS).iterator():
+                histogram = histograms.get(product.id, {})
+                values = {f"rating_{i}": histogram.get(i, 0) for i in range(1, 6)}
+                values["rating_count"] = sum(histogram.values())
+                values["rating_sum"] = sum(s * n for s, n in histogram.items())
+                if all(getattr(product, k) == v for k, v in values.items()):
+                    continue
+                for name, value in values.items():
+                    setattr(product, name, value)
+                # Новая версия фрагментов товара, как у Product.apply_review
+                product.updated_at = now
+                updated.append(product)
+            Product.objects.bulk_update(
+                updated,
+                [*RATING_FIELDS, "updated_at"],
+                batch_size=options["batch_size"],
+            )
+            # bulk_update не шлёт сигналов: кэш списков сбрасываем сами
+            if updated:
+                transaction.on_commit(partial(bump_generation, Product))
+                mark_dirty([product.pk for product in updated])
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено товаров: {len(updated)}"))
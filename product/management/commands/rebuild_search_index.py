@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from product.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        rebuild_search_index(connections[options["database"]])
+        self.stdout.write(self.style.SUCCESS("Поисковый индекс перестроен"))
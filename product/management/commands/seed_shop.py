@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from common.cache import bump_generation
+from product.models import Category, Product, Review
+from users.models import CustomUser
+
+SEED_PASSWORD = "seed-password"
+# Отзывы разбросаны по году после SEED_EPOCH: сортировка по дате не вырождается
+SEED_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+SEED_SPAN = 365 * 24 * 60 * 60
+WORDS = (
+    "красный синий лёгкий прочный умный быстрый тихий компактный "
+    "чайник телефон кроссовки рюкзак лампа куртка наушники стол"
+).split()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Заполняет базу воспроизводимым набором пользователей, товаров и отзывов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--reviews", type=int, default=500000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--password", default=SEED_PASSWORD)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.prefix = f"seed{options['seed']}"
+        if CustomUser.objects.filter(email__startswith=f"{self.prefix}-").exists():
+            raise CommandError(f"Данные с --seed {options['seed']} уже загружены")
+        if options["users"] < 1 or options["categories"] < 1:
+            raise CommandError("Нужен хотя бы один пользователь и одна категория")
+
+        user_ids = self.create_users(options["users"], options["password"])
+        category_ids = self.create_categories(options["categories"])
+        product_ids = self.create_products(options["products"], user_ids, category_ids)
+        if product_ids:
+            self.create_reviews(options["reviews"], user_ids, product_ids)
+
+        # bulk_create не шлёт сигналов: агрегаты и кэши обновляем сами
+        call_command("rebuild_ratings", stdout=self.stdout)
+        call_command("rebuild_category_counts", stdout=self.stdout)
+        for model in (CustomUser, Category, Product, Review):
+            bump_generation(model)
+
+    def insert(self, model, rows, return_ids=True):
+        """Вставляет пачками в одной транзакции; возвращает id новых строк"""
+        started = time.perf_counter()
+        last_id = model.objects.order_by("-id").values_list("id", flat=True).first()
+        created = 0
+        with transaction.atomic():
+            for batch in batched(rows, self.batch_size):
+                model.objects.bulk_create(batch)
+                created += len(batch)
+        self.stdout.write(
+            f"{model._meta.model_name}: {created} "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
+        if not return_ids:
+            return None
+        # id читаем из базы: не все бэкенды возвращают их из bulk_create
+        return list(
+            model.objects.filter(id__gt=last_id or 0)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def create_users(self, count, password):
+        # Хэш считается один раз: PBKDF2 на каждого пользователя занял бы часы
+        password = make_password(password)
+        born_after = date(1960, 1, 1)
+        rows = (
+            CustomUser(
+                email=f"{self.prefix}-{i}@example.com",
+                username=f"{self.prefix}-{i}",
+                password=password,
+                first_name=self.rng.choice(("Иван", "Анна", "Пётр", "Мария")),
+                last_name=self.rng.choice(("Иванов", "Смирнова", "Петров", "Кузнецова")),
+                birthday=born_after + timedelta(days=self.rng.randrange(365 * 40)),
+            )
+            for i in range(count)
+        )
+        return self.insert(CustomUser, rows)
+
+    def create_categories(self, count):
+        rows = (Category(name=f"{self.rng.choice(WORDS)} {i}"[:50]) for i in range(count))
+        return self.insert(Category, rows)
+
+    def create_products(self, count, user_ids, category_ids):
+        rows = (
+            Product(
+                title=" ".join(self.rng.sample(WORDS, 3))[:50],
+                description=" ".join(self.rng.choices(WORDS, k=20)),
+                price=round(self.rng.uniform(1, 999), 2),
+                category_id=self.rng.choice(category_ids),
+                owner_id=self.rng.choice(user_ids),
+            )
+            for _ in range(count)
+        )
+        return self.insert(Product, rows)
+
+    def create_reviews(self, count, user_ids, product_ids):
+        rows = (
+            Review(
+                text=" ".join(self.rng.choices(WORDS, k=8)),
+                # Популярные товары получают больше отзывов, как в жизни
+                product_id=self.pick_product(product_ids),
+                owner_id=self.rng.choice(user_ids),
+                stars=self.rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 2, 4, 6))[0],
+                created=SEED_EPOCH + timedelta(seconds=self.rng.randrange(SEED_SPAN)),
+            )
+            for _ in range(count)
+        )
+        self.insert(Review, rows, return_ids=False)
+
+    def pick_product(self, product_ids):
+        # Половина отзывов уходит на «популярные» товары в начале списка
+        if self.rng.random() < 0.5:
+            index = int(self.rng.paretovariate(1.2)) - 1
+            return product_ids[min(index, len(product_ids) - 1)]
+        return self.rng.choice(product_ids)
@@ -1,12 +1,29 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils import timezone
 
 
 class Category(models.Model):
     name = models.CharField(max_length=50)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def apply_products_count(cls, category_id, delta):
+        cls.objects.filter(id=category_id).update(
+            products_count=F("products_count") + delta, updated_at=Now()
+        )
+
+    @classmethod
+    def apply_products_counts(cls, deltas):
+        for category_id, delta in deltas.items():
+            if delta:
+                cls.apply_products_count(category_id, delta)
+
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
@@ -20,15 +37,60 @@ class Product(models.Model):
     owner = models.ForeignKey(
         "users.CustomUser", on_delete=models.CASCADE, related_name="customuser"
     )
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get("category_id")
+        return instance
+
+    @property
+    def rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    @property
+    def rating_histogram(self):
+        return {i: getattr(self, f"rating_{i}") for i in range(1, 6)}
+
+    @classmethod
+    def apply_review(cls, product_id, stars, sign=1):
+        """Атомарно добавляет (sign=1) или убирает (sign=-1) оценку из агрегатов"""
+        cls.objects.filter(id=product_id).update(
+            rating_sum=F("rating_sum") + sign * stars,
+            rating_count=F("rating_count") + sign,
+            updated_at=Now(),
+            **{f"rating_{stars}": F(f"rating_{stars}") + sign},
+        )
+
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        indexes = [models.Index(fields=["category", "price"])]
 
 
+RATING_FIELDS = (
+    "rating_sum",
+    "rating_count",
+    "rating_1",
+    "rating_2",
+    "rating_3",
+    "rating_4",
+    "rating_5",
+)
+
 STARS = ((i, "⭐" * i) for i in range(1, 6))
 
 
@@ -41,10 +103,29 @@ class Review(models.Model):
     owner = models.ForeignKey(
         "users.CustomUser", on_delete=models.CASCADE, related_name="reviews"
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # default, а не auto_now_add: seed_shop задаёт время создания сам
+    created = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f"Отзыв на {self.product.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем сохранённые значения, чтобы при изменении отзыва
+        # скорректировать агрегаты без дополнительного запроса
+        instance._loaded_rating = (
+            instance.__dict__.get("product_id"),
+            instance.__dict__.get("stars"),
+        )
+        return instance
+
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        # Под ленту отзывов товара: id — последний ключ keyset-пагинации
+        indexes = [
+            models.Index(fields=["product", "created", "id"]),
+            models.Index(fields=["product", "stars", "id"]),
+        ]
@@ -0,0 +1,46 @@
+"""Отзывы, вложенные в ленту товаров: не все, а первые NESTED_REVIEWS_LIMIT
+на товар — последние или лучшие. Остальные — в ленте отзывов товара."""
+
+from django.conf import settings
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+
+from .models import Review
+
+REVIEW_SORTS = {"newest": ("-created", "-id"), "top": ("-stars", "-id")}
+# Сортировки ленты отзывов товара, ?ordering=...
+REVIEW_KEYSET_ORDERINGS = {
+    "-created": ("-created", "-id"),
+    "-stars": ("-stars", "-id"),
+    "stars": ("stars", "id"),
+}
+DEFAULT_REVIEW_SORT = "newest"
+
+
+def get_review_sort(request):
+    sort = request.query_params.get("reviews_sort")
+    return sort if sort in REVIEW_SORTS else DEFAULT_REVIEW_SORT
+
+
+def top_reviews_prefetch(sort):
+    """Кладёт первые отзывы каждого товара в product.top_reviews.
+    Срез в Prefetch Django выполняет одним запросом с
+    ROW_NUMBER() OVER (PARTITION BY product_id ...)"""
+    queryset = Review.objects.order_by(*REVIEW_SORTS[sort])
+    return Prefetch(
+        "reviews",
+        queryset=queryset[: settings.NESTED_REVIEWS_LIMIT],
+        to_attr="top_reviews",
+    )
+
+
+def top_reviews(product_ids, sort):
+    """То же для строк values(): отзывы товаров, пронумерованные внутри товара"""
+    numbered = Review.objects.filter(product_id__in=product_ids).annotate(
+        position=Window(
+            RowNumber(), partition_by=F("product_id"), order_by=REVIEW_SORTS[sort]
+        )
+    )
+    return numbered.filter(position__lte=settings.NESTED_REVIEWS_LIMIT).order_by(
+        "product_id", "position"
+    )
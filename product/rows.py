@@ -0,0 +1,147 @@
+"""Ответы списков из строк values() без полей сериализаторов DRF.
+
+Используется при FAST_READ_PATH. Поля и их формат повторяют сериализаторы
+байт в байт (проверяет FastReadPathTests), поэтому при изменении
+сериализатора меняется и формат строк здесь. Значения преобразуются
+столбцами: одна функция на весь столбец страницы, а не поле на каждую строку.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from common.renderers import FastRendererMixin
+
+from .reviews import top_reviews
+
+
+def datetimes(column):
+    """Как DateTimeField DRF: ISO 8601 в текущей зоне, UTC — с Z"""
+    if settings.USE_TZ:
+        tz = timezone.get_current_timezone()
+        values = [None if value is None else value.astimezone(tz) for value in column]
+    else:
+        values = column
+    values = [None if value is None else datetime.isoformat(value) for value in values]
+    return [
+        value[:-6] + "Z" if value and value.endswith("+00:00") else value
+        for value in values
+    ]
+
+
+def decimals(column):
+    """Как DecimalField DRF. Значения из БД уже округлены до decimal_places,
+    остаётся записать их строкой без экспоненты"""
+    if not api_settings.COERCE_DECIMAL_TO_STRING:
+        return column
+    return [None if value is None else format(value, "f") for value in column]
+
+
+class RowFormat:
+    """Поля values() и преобразования их столбцов"""
+
+    def __init__(self, fields, converters=None):
+        self.fields = fields
+        self.converters = converters or {}
+
+    def values(self, queryset):
+        return queryset.values(*self.fields)
+
+    def convert(self, rows):
+        rows = [dict(row) for row in rows]
+        for name, convert in self.converters.items():
+            column = convert([row[name] for row in rows])
+            for row, value in zip(rows, column):
+                row[name] = value
+        return rows
+
+    def rows(self, queryset):
+        return self.convert(self.values(queryset))
+
+
+# Порядок полей — как у ModelSerializer: pk, обычные поля, затем внешние ключи
+PRODUCT_ROWS = RowFormat(
+    ("id", "title", "description", "price", "updated_at", "category", "owner"),
+    {"price": decimals, "updated_at": datetimes},
+)
+CATEGORY_ROWS = RowFormat(("id", "name", "products_count"))
+REVIEW_ROWS = RowFormat(
+    ("id", "text", "stars", "updated_at", "created", "product", "owner"),
+    {"updated_at": datetimes, "created": datetimes},
+)
+NESTED_CATEGORY_ROWS = RowFormat(
+    ("id", "name", "products_count", "updated_at"), {"updated_at": datetimes}
+)
+
+
+def product_with_reviews_rows(queryset, sort):
+    """Строки ProductWithReviewsSerializer: товар, категория и первые отзывы
+    двумя запросами"""
+    products = list(
+        queryset.values(
+            "id",
+            "title",
+            "description",
+            "price",
+            "category_id",
+            "category__name",
+            "category__products_count",
+            "category__updated_at",
+            "rating_sum",
+            "rating_count",
+        )
+    )
+    categories = NESTED_CATEGORY_ROWS.convert(
+        {
+            "id": product["category_id"],
+            "name": product["category__name"],
+            "products_count": product["category__products_count"],
+            "updated_at": product["category__updated_at"],
+        }
+        for product in products
+    )
+    reviews = defaultdict(list)
+    product_ids = [product["id"] for product in products]
+    for review in REVIEW_ROWS.rows(top_reviews(product_ids, sort)):
+        reviews[review["product"]].append(review)
+
+    prices = decimals([product["price"] for product in products])
+    return [
+        {
+            "id": product["id"],
+            "title": product["title"],
+            "description": product["description"],
+            "price": price,
+            "category": category,
+            "reviews": reviews[product["id"]],
+            "reviews_total": product["rating_count"],
+            "reviews_url": reverse("product-reviews", kwargs={"id": product["id"]}),
+            "rating": (
+                round(product["rating_sum"] / product["rating_count"], 2)
+                if product["rating_count"]
+                else None
+            ),
+        }
+        for product, category, price in zip(products, categories, prices)
+    ]
+
+
+class RowListMixin(FastRendererMixin):
+    """Для списков: при FAST_READ_PATH страница читается через values()
+    и отдаётся строками row_format без сериализатора"""
+
+    row_format = None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_READ_PATH:
+            return super().list(request, *args, **kwargs)
+        queryset = self.row_format.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.row_format.convert(page))
+        return Response(self.row_format.convert(queryset))
@@ -0,0 +1,124 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+FTS_TABLE = "product_product_fts"
+GIN_INDEX_NAME = "product_search_gin"
+
+SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='product_product', content_rowid='id'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON product_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON product_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, description ON product_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+# Заголовок весит больше описания
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def get_search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector("title", weight="A", config="simple") + SearchVector(
+        "description", weight="B", config="simple"
+    )
+
+
+def ensure_search_index(using=connection):
+    """Создаёт FTS5-таблицу с триггерами (SQLite) или GIN-индекс (Postgres)"""
+    if using.vendor == "sqlite":
+        with using.cursor() as cursor:
+            exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE]
+            ).fetchone()
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            if not exists:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif using.vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+
+        with using.cursor() as cursor:
+            constraints = using.introspection.get_constraints(
+                cursor, Product._meta.db_table
+            )
+        if GIN_INDEX_NAME not in constraints:
+            index = GinIndex(get_search_vector(), name=GIN_INDEX_NAME)
+            with using.schema_editor() as schema_editor:
+                schema_editor.add_index(Product, index)
+
+
+def rebuild_search_index(using=connection):
+    ensure_search_index(using)
+    with using.cursor() as cursor:
+        if using.vendor == "sqlite":
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif using.vendor == "postgresql":
+            cursor.execute(f"REINDEX INDEX {GIN_INDEX_NAME}")
+
+
+def search_products(queryset, query):
+    """Фильтрует и ранжирует товары по title и description"""
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return queryset.none()
+
+    vendor = connection.vendor
+    if vendor == "sqlite":
+        # Каждое слово — отдельный префиксный терм, спецсинтаксис FTS5 экранируется
+        match = " ".join(f'"{token}"*' for token in tokens)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f"{FTS_TABLE}.rowid = product_product.id",
+                f"{FTS_TABLE} MATCH %s",
+            ],
+            params=[match],
+            select={
+                "rank": f"bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})"
+            },
+            order_by=["rank", "id"],
+        )
+    if vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        vector = get_search_vector()
+        search_query = SearchQuery(" ".join(tokens), config="simple")
+        return (
+            queryset.annotate(search=vector, rank=SearchRank(vector, search_query))
+            .filter(search=search_query)
+            .order_by("-rank", "id")
+        )
+
+    condition = Q()
+    for token in tokens:
+        condition &= Q(title__icontains=token) | Q(description__icontains=token)
+    return queryset.filter(condition).order_by("id")
@@ -1,18 +1,16 @@
+from decimal import Decimal
+
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Category, Product, Review
+from .models import RATING_FIELDS, Category, Product, Review
 from rest_framework.exceptions import ValidationError
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    products_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Category
         fields = ["id", "name", "products_count"]
 
-    def get_products_count(self, category):
-        return Product.objects.filter(category=category).count()
-
 
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,11 +21,14 @@ class ReviewSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = RATING_FIELDS
 
 
 class ProductWithReviewsSerializer(serializers.ModelSerializer):
-    # reviews = ReviewSerializer(many=True, read_only=True)
+    # Только первые отзывы: queryset подгружает их через top_reviews_prefetch
+    reviews = ReviewSerializer(many=True, read_only=True, source="top_reviews")
+    reviews_total = serializers.IntegerField(source="rating_count", read_only=True)
+    reviews_url = serializers.SerializerMethodField()
     rating = serializers.SerializerMethodField()
 
     class Meta:
@@ -39,15 +40,18 @@ class ProductWithReviewsSerializer(serializers.ModelSerializer):
             "price",
             "category",
             "reviews",
+            "reviews_total",
+            "reviews_url",
             "rating",
         ]
         depth = 1
 
+    def get_reviews_url(self, obj):
+        # Без хоста: ответ попадает в общий кэш фрагментов
+        return reverse("product-reviews", kwargs={"id": obj.id})
+
     def get_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            return round(sum([r.stars for r in reviews]) / reviews.count(), 2)
-        return None
+        return obj.rating
 
 
 class CategoryValidateSerializer(serializers.Serializer):
@@ -67,6 +71,43 @@ class ProductValidateSerializer(serializers.Serializer):
             raise ValidationError("Category does not exist")
 
 
+class ProductExportValidateSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=["ndjson", "csv"], default="ndjson")
+    updated_since = serializers.DateTimeField(required=False)
+
+
+def model_field(model, name):
+    return model._meta.get_field(name)
+
+
+class ProductBulkValidateSerializer(ProductValidateSerializer):
+    """Категории проверяются одним in_bulk во view, а не запросом на элемент.
+
+    Ограничения полей берутся из модели: элемент, который не влезет в
+    колонку, получает свой 400, а не обрывает всю пачку ошибкой базы"""
+
+    title = serializers.CharField(
+        min_length=2, max_length=model_field(Product, "title").max_length
+    )
+    price = serializers.DecimalField(
+        max_digits=model_field(Product, "price").max_digits,
+        decimal_places=model_field(Product, "price").decimal_places,
+        min_value=Decimal("0.01"),
+    )
+    category = serializers.IntegerField(
+        min_value=1, validators=model_field(Category, "id").validators
+    )
+
+    def validate_category(self, category_id):
+        return category_id
+
+
+class ProductBulkUpdateValidateSerializer(ProductBulkValidateSerializer):
+    id = serializers.IntegerField(
+        min_value=1, validators=model_field(Product, "id").validators
+    )
+
+
 class ReviewValidateSerializer(serializers.Serializer):
     text = serializers.CharField(required=True, min_length=1)
     stars = serializers.IntegerField(min_value=1, max_value=5)
@@ -77,3 +118,19 @@ class ReviewValidateSerializer(serializers.Serializer):
             return Product.objects.get(id=product_id)
         except Product.DoesNotExist:
             raise ValidationError("Product does not exist")
+
+
+class ProductFilterValidateSerializer(serializers.Serializer):
+    category = serializers.IntegerField(
+        required=False, min_value=1, validators=model_field(Category, "id").validators
+    )
+    price_min = serializers.DecimalField(
+        required=False, max_digits=5, decimal_places=2, min_value=0
+    )
+    price_max = serializers.DecimalField(
+        required=False, max_digits=5, decimal_places=2, min_value=0
+    )
+    min_rating = serializers.FloatField(required=False, min_value=1, max_value=5)
+    ordering = serializers.ChoiceField(
+        required=False, choices=["id", "-id", "price", "-price"]
+    )
@@ -0,0 +1,88 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from common.cache import bump_generation
+from .fragments import mark_dirty
+from .models import Category, Product, Review
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def refresh_fragments(sender, instance, **kwargs):
+    if sender is Category:
+        mark_dirty(category_ids=[instance.pk])
+        return
+    mark_dirty([instance.pk])
+
+
+# Отзывы входят во фрагмент товара, поэтому их изменение меняет версию
+# товара (updated_at) — тем же UPDATE, что и агрегаты рейтинга
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    current = (instance.product_id, instance.stars)
+    loaded = None if created else getattr(instance, "_loaded_rating", current)
+    if loaded == current:
+        Product.objects.filter(id=instance.product_id).update(updated_at=Now())
+    else:
+        with transaction.atomic():
+            if loaded is not None:
+                Product.apply_review(*loaded, sign=-1)
+            Product.apply_review(*current)
+        instance._loaded_rating = current
+    mark_dirty([instance.product_id])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product(sender, instance, origin=None, **kwargs):
+    # pre_delete всех объектов каскада приходит раньше post_delete отзывов:
+    # помечаем на origin, чьи отзывы удаляются вместе с товаром
+    if origin is not None:
+        deleted = getattr(origin, "_deleted_product_ids", set())
+        deleted.add(instance.pk)
+        origin._deleted_product_ids = deleted
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, origin=None, **kwargs):
+    product_id, stars = getattr(instance, "_loaded_rating", None) or (
+        instance.product_id,
+        instance.stars,
+    )
+    # Товар удаляется каскадом: его агрегаты и фрагмент уже не нужны
+    if product_id in getattr(origin, "_deleted_product_ids", ()):
+        return
+    Product.apply_review(product_id, stars, sign=-1)
+    mark_dirty([product_id])
+
+
+@receiver(post_save, sender=Product)
+def update_products_count_on_save(sender, instance, created, **kwargs):
+    current = instance.category_id
+    loaded = None if created else getattr(instance, "_loaded_category_id", current)
+    if loaded == current:
+        return
+    with transaction.atomic():
+        if loaded is not None:
+            Category.apply_products_count(loaded, -1)
+        Category.apply_products_count(current, 1)
+    instance._loaded_category_id = current
+
+
+@receiver(post_delete, sender=Product)
+def update_products_count_on_delete(sender, instance, **kwargs):
+    loaded = getattr(instance, "_loaded_category_id", instance.category_id)
+    Category.apply_products_count(loaded, -1)
+
+
+# Регистрируется после счётчиков выше: поколение меняется, когда агрегаты
+# уже записаны и закоммичены, иначе запрос между сменой поколения и коммитом
+# закэширует старые значения под новым ключом
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_list_cache(sender, **kwargs):
+    transaction.on_commit(partial(bump_generation, sender))
@@ -1,2 +1,1140 @@
+import base64
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from threading import Barrier, Timer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+from redis.exceptions import RedisError
+from rest_framework.generics import GenericAPIView
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common.cache import (
+    CacheEntry,
+    acquire_lock,
+    bump_generation,
+    get_or_compute,
+    release_lock,
+)
+from common.renderers import Fragment, FragmentJSONRenderer, ORJSONRenderer
+from common.testing import QueryBudgetMixin
+from product.fragments import FRAGMENTS
+from product.reviews import top_reviews_prefetch
+from product.search import search_products
+from product.models import Category, Product, Review
+from product.views import CategoryListCreateAPIView
+from users.models import CustomUser
+from users.tests import LOCMEM_CACHES
+
+# Кэш-пустышка: меряем холодный путь, а не попадание в кэш списка
+DUMMY_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def seed_shop(categories=4, products_per_category=15, reviews_per_product=4):
+    password = make_password("password")
+    owner, *reviewers = CustomUser.objects.bulk_create(
+        CustomUser(
+            email=f"user{i}@example.com",
+            username=f"user{i}",
+            password=password,
+        )
+        for i in range(reviews_per_product + 1)
+    )
+    category_objs = Category.objects.bulk_create(
+        Category(name=f"Категория {i}") for i in range(categories)
+    )
+    products = Product.objects.bulk_create(
+        Product(
+            title=f"Товар {c}-{i}",
+            description="Описание товара",
+            price=10 + i,
+            category=category,
+            owner=owner,
+        )
+        for c, category in enumerate(category_objs)
+        for i in range(products_per_category)
+    )
+    Review.objects.bulk_create(
+        Review(
+            text="Отзыв",
+            product=product,
+            owner=reviewer,
+            stars=i % 5 + 1,
+        )
+        for product in products
+        for i, reviewer in enumerate(reviewers)
+    )
+    call_command("rebuild_ratings", stdout=StringIO())
+    call_command("rebuild_category_counts", stdout=StringIO())
+    return owner, products
+
+
+@override_settings(CACHES=DUMMY_CACHES, REPLICA_DATABASES=[])
+class ProductQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Число запросов на эндпоинт не должно зависеть от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.products = seed_shop()
+        cls.product = cls.products[0]
+        cls.category = cls.product.category
+        cls.admin = CustomUser.objects.create_superuser("admin@example.com", "admin")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, budget, url, **kwargs):
+        response = self.assertQueryBudget(budget, self.client.get, url, **kwargs)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_product_list(self):
+        # count + id страницы + промахи фрагментов + фасеты (категории и цены)
+        self.get(5, "/api/v1/products/")
+        self.get(5, "/api/v1/products/?category=%d&min_rating=2" % self.category.id)
+
+    def test_facets_are_computed_for_first_page(self):
+        self.assertIsNotNone(self.get(5, "/api/v1/products/").data["facets"])
+        # count + id страницы + промахи фрагментов, без двух агрегатов
+        self.assertIsNone(self.get(3, "/api/v1/products/?page=2").data["facets"])
+        first = self.get(4, "/api/v1/products/?pagination=cursor")
+        self.assertIsNotNone(first.data["facets"])
+        self.assertIsNone(self.get(2, first.data["next"]).data["facets"])
+        self.assertIsNotNone(
+            self.get(5, "/api/v1/products/?page=2&facets=1").data["facets"]
+        )
+
+    def test_product_list_page_size_does_not_matter(self):
+        for page_size in (2, 50):
+            self.get(4, f"/api/v1/products/?pagination=cursor&page_size={page_size}")
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_product_list_from_fragments(self):
+        cache.clear()
+        cold = self.get(5, "/api/v1/products/")
+        # Кэш списка сброшен, фрагменты товаров остались
+        bump_generation(Product)
+        warm = self.get(4, "/api/v1/products/")
+        self.assertEqual(warm.json(), cold.json())
+        self.assertEqual(cold.json()["results"][0]["id"], self.products[0].id)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_changed_product_gets_new_fragment(self):
+        cache.clear()
+        self.get(5, "/api/v1/products/")
+        Product.objects.filter(id=self.product.id).update(title="Переименован")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(id=self.product.id).save()
+        response = self.get(5, "/api/v1/products/")
+        self.assertEqual(response.json()["results"][0]["title"], "Переименован")
+
+    def test_categories(self):
+        self.get(2, "/api/v1/products/categories/")
+        self.authenticate(self.admin)
+        # пользователь + категория
+        self.get(2, f"/api/v1/products/categories/{self.category.id}/")
+
+    def test_product_detail(self):
+        self.authenticate(self.owner)
+        self.get(2, f"/api/v1/products/{self.product.id}/")
+
+    def test_products_with_reviews(self):
+        # count + id страницы + промахи фрагментов + отзывы одним оконным запросом
+        self.get(4, "/api/v1/products/reviews/")
+        self.get(4, "/api/v1/products/reviews/?reviews_sort=top")
+
+    def test_product_reviews(self):
+        # версия товара для ETag + страница keyset, без COUNT(*)
+        for ordering in ("-created", "-stars", "stars"):
+            url = f"/api/v1/products/{self.product.id}/reviews/?ordering={ordering}"
+            self.get(2, url)
+
+    def test_search(self):
+        self.get(3, "/api/v1/products/search/?q=Товар")
+
+    def test_my_products(self):
+        self.authenticate(self.owner)
+        # пользователь (снимок кэша аутентификации) + count + страница
+        # + промахи фрагментов
+        self.get(4, "/api/v1/products/my/")
+
+    def test_export(self):
+        response = self.assertQueryBudget(0, self.client.get, "/api/v1/products/export/")
+        # Строки читаются при отдаче потока
+        self.assertQueryBudget(1, b"".join, response.streaming_content)
+
+    def test_async_views(self):
+        # count + страница + фасеты (категории и цены)
+        self.get(4, "/api/v1/products/async/")
+        self.get(2, "/api/v1/products/async/?page=2")
+        self.get(3, "/api/v1/products/async/reviews/")
+        self.authenticate(self.owner)
+        self.get(2, f"/api/v1/products/async/{self.product.id}/")
+
+    def test_bulk_update(self):
+        self.authenticate(self.owner)
+        items = [
+            {
+                "id": product.id,
+                "title": product.title,
+                "price": 99,
+                "category": product.category_id,
+            }
+            for product in self.products[:20]
+        ]
+        # пользователь + товары и категории через in_bulk + один bulk_update
+        response = self.assertQueryBudget(
+            4, self.client.put, "/api/v1/products/bulk/", items, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    @override_settings(FAST_READ_PATH=False)
+    def test_n_plus_one_is_reported_with_serializer_field(self):
+        spec = FRAGMENTS["product_with_newest_reviews"]
+        # Без select_related("category")
+        queryset = Product.objects.prefetch_related(top_reviews_prefetch("newest"))
+        with mock.patch.object(spec, "queryset", queryset):
+            with self.assertRaisesRegex(
+                AssertionError, r"from ProductWithReviewsSerializer\.category"
+            ):
+                self.get(4, "/api/v1/products/reviews/")
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+    REPLICA_DATABASES=[],
+    NESTED_REVIEWS_LIMIT=3,
+    # Обход ленты по курсорам упирается в лимит анонимов
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class NestedReviewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, products = seed_shop(categories=1, products_per_category=2)
+        cls.product = products[0]
+        cls.reviews = list(cls.product.reviews.order_by("id"))
+
+    def get_product(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()["results"]
+        return next(item for item in results if item["id"] == self.product.id)
+
+    def test_only_newest_reviews_are_embedded(self):
+        for fast in (False, True):
+            with self.subTest(fast=fast), override_settings(FAST_READ_PATH=fast):
+                product = self.get_product("/api/v1/products/reviews/")
+                ids = [review["id"] for review in product["reviews"]]
+                self.assertEqual(ids, [r.id for r in reversed(self.reviews)][:3])
+                self.assertEqual(product["reviews_total"], 4)
+
+    def test_top_reviews(self):
+        product = self.get_product("/api/v1/products/reviews/?reviews_sort=top")
+        stars = [review["stars"] for review in product["reviews"]]
+        expected = sorted((review.stars for review in self.reviews), reverse=True)
+        self.assertEqual(stars, expected[:3])
+
+    def test_reviews_url_lists_all_reviews(self):
+        product = self.get_product("/api/v1/products/reviews/")
+        response = self.client.get(product["reviews_url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 4)
+
+    def walk_feed(self, ordering):
+        """Проходит ленту отзывов товара по курсорам, по 3 на страницу"""
+        url = f"/api/v1/products/{self.product.id}/reviews/"
+        url += f"?ordering={ordering}&page_size=3"
+        reviews = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            reviews += response.data["results"]
+            url = response.data["next"]
+        return reviews
+
+    def test_review_feed_orderings(self):
+        base = timezone.now()
+        for review, stars in zip(self.reviews, (3, 5, 3, 1)):
+            Review.objects.filter(id=review.id).update(
+                stars=stars, created=base - timedelta(days=review.id % 3)
+            )
+        extra = Review.objects.create(
+            text="Ещё", product=self.product, owner=self.reviews[0].owner, stars=3
+        )
+        reviews = list(Review.objects.filter(product=self.product))
+        orderings = {
+            "-created": lambda r: (-r.created.timestamp(), -r.id),
+            "-stars": lambda r: (-r.stars, -r.id),
+            "stars": lambda r: (r.stars, r.id),
+        }
+        for ordering, key in orderings.items():
+            with self.subTest(ordering=ordering):
+                ids = [review["id"] for review in self.walk_feed(ordering)]
+                self.assertEqual(ids, [r.id for r in sorted(reviews, key=key)])
+        self.assertEqual(self.walk_feed("-created")[0]["id"], extra.id)
+
+    def test_reviews_of_missing_product(self):
+        response = self.client.get("/api/v1/products/999999/reviews/")
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class ProductBulkTests(TestCase):
+    """Ошибка элемента пачки — его собственный статус, остальные сохраняются"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, products = seed_shop(categories=1, products_per_category=2)
+        cls.product, cls.foreign = products
+        cls.category = cls.product.category
+        cls.stranger = CustomUser.objects.create_user("stranger@example.com", "x")
+        Product.objects.filter(id=cls.foreign.id).update(owner=cls.stranger)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = AccessToken.for_user(self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def item(self, **values):
+        item = {"title": "Товар", "price": "10.50", "category": self.category.id}
+        return {**item, **values}
+
+    def bulk(self, method, items):
+        response = getattr(self.client, method)(
+            "/api/v1/products/bulk/", items, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_create_with_invalid_items(self):
+        data = self.bulk(
+            "post",
+            [
+                self.item(),
+                self.item(title="т" * 51),
+                self.item(price="1000"),
+                self.item(price="1.005"),
+                self.item(category=999999),
+                self.item(category=2**70),
+            ],
+        )
+        statuses = [result["status"] for result in data["results"]]
+        self.assertEqual(statuses, [201, 400, 400, 400, 400, 400])
+        self.assertEqual(data["created"], 1)
+        self.assertIn("title", data["results"][1]["errors"])
+        self.assertIn("price", data["results"][2]["errors"])
+        self.assertEqual(Product.objects.filter(category=self.category).count(), 3)
+
+    def test_update_with_invalid_items(self):
+        data = self.bulk(
+            "put",
+            [
+                self.item(id=self.product.id, title="Новое имя"),
+                self.item(id=self.foreign.id, title="Чужой"),
+                self.item(id=999999),
+                self.item(id=self.product.id, price="-1"),
+            ],
+        )
+        statuses = [result["status"] for result in data["results"]]
+        self.assertEqual(statuses, [200, 403, 404, 400])
+        self.assertEqual(data["updated"], 1)
+        self.product.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.product.title, "Новое имя")
+        self.assertNotEqual(self.foreign.title, "Чужой")
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class ConditionalRequestTests(TestCase):
+    """304 по If-None-Match и 412 по устаревшему If-Match"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, products = seed_shop(categories=1, products_per_category=1)
+        cls.product = products[0]
+        cls.admin = CustomUser.objects.create_superuser("admin@example.com", "admin")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        token = AccessToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_product_detail(self):
+        self.authenticate(self.owner)
+        url = f"/api/v1/products/{self.product.id}/"
+        etag = self.assertNotModified(url)
+        data = {
+            "title": "Новое имя",
+            "price": 20,
+            "category": self.product.category_id,
+        }
+        response = self.client.put(url, data, format="json", HTTP_IF_MATCH='"old"')
+        self.assertEqual(response.status_code, 412)
+        self.product.refresh_from_db()
+        self.assertNotEqual(self.product.title, "Новое имя")
+
+        response = self.client.put(url, data, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.put(url, data, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+    def test_write_between_check_and_update_gets_412(self):
+        self.authenticate(self.owner)
+        url = f"/api/v1/products/{self.product.id}/"
+        etag = self.client.get(url)["ETag"]
+        get_object = GenericAPIView.get_object
+
+        def write_after_check(view):
+            obj = get_object(view)
+            # Другой запрос успел записать после проверки версии
+            Product.objects.filter(id=obj.id).update(
+                title="Чужая правка", updated_at=timezone.now() + timedelta(seconds=1)
+            )
+            return obj
+
+        data = {
+            "title": "Новое имя",
+            "price": 20,
+            "category": self.product.category_id,
+        }
+        with mock.patch.object(GenericAPIView, "get_object", write_after_check):
+            response = self.client.put(url, data, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.product.refresh_from_db()
+        self.assertNotEqual(self.product.title, "Новое имя")
+
+    def test_category_detail(self):
+        self.authenticate(self.admin)
+        url = f"/api/v1/products/categories/{self.product.category_id}/"
+        self.assertNotModified(url)
+        response = self.client.delete(url, HTTP_IF_MATCH='"old"')
+        self.assertEqual(response.status_code, 412)
+        self.assertTrue(Category.objects.filter(id=self.product.category_id).exists())
+
+    def test_review_feed(self):
+        url = f"/api/v1/products/{self.product.id}/reviews/"
+        etag = self.assertNotModified(url)
+        self.assertNotEqual(self.client.get(url + "?ordering=stars")["ETag"], etag)
+        Review.objects.create(
+            text="Новый", product=self.product, owner=self.owner, stars=5
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["results"]), 5)
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class SearchPaginationTests(TestCase):
+    """Выдача поиска идёт по рангу на всех страницах"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, products = seed_shop(categories=1, products_per_category=7)
+        # Разное число вхождений перемешивает ранг относительно id
+        for i, product in enumerate(products):
+            Product.objects.filter(id=product.id).update(
+                title=f"Чайник {product.id}", description="чайник " * (i * 3 % 7)
+            )
+        ranked = search_products(Product.objects.all(), "чайник")
+        cls.ranked = [product.id for product in ranked]
+
+    def test_rank_differs_from_id_order(self):
+        self.assertNotEqual(self.ranked, sorted(self.ranked))
+
+    def test_rank_order_holds_across_pages(self):
+        ids = []
+        for page in (1, 2):
+            response = self.client.get(f"/api/v1/products/search/?q=чайник&page={page}")
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [product["id"] for product in response.json()["results"]]
+        self.assertEqual(ids, self.ranked)
+
+    def test_cursor_pagination_is_rejected(self):
+        for query in ("pagination=cursor", "cursor=abc"):
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/v1/products/search/?q=чайник&{query}")
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class AsyncListContractTests(TestCase):
+    """Асинхронный список товаров отвечает как синхронный, кроме курсоров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, products = seed_shop(categories=2, products_per_category=7)
+        cls.category = products[0].category
+
+    def test_same_response_as_sync_list(self):
+        queries = [
+            "",
+            "?page=2",
+            f"?category={self.category.id}&ordering=-price",
+            "?price_min=12&min_rating=2&page=2&facets=1",
+        ]
+        for query in queries:
+            with self.subTest(query=query):
+                expected = self.client.get(f"/api/v1/products/{query}").json()
+                for link in ("next", "previous"):
+                    if expected[link]:
+                        expected[link] = expected[link].replace(
+                            "/products/", "/products/async/"
+                        )
+                response = self.client.get(f"/api/v1/products/async/{query}")
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(response.json(), expected)
+
+    def test_invalid_filter(self):
+        queries = {"price_min": "?price_min=abc", "category": f"?category={2**70}"}
+        for field, query in queries.items():
+            for url in ("", "async/"):
+                with self.subTest(url=url, query=query):
+                    response = self.client.get(f"/api/v1/products/{url}{query}")
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(field, response.json())
+
+    def test_cursor_pagination_is_rejected(self):
+        for query in ("?pagination=cursor", "?cursor=abc"):
+            with self.subTest(query=query):
+                for url in ("async/", "async/reviews/"):
+                    response = self.client.get(f"/api/v1/products/{url}{query}")
+                    self.assertEqual(response.status_code, 400)
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class MalformedCursorTests(TestCase):
+    """Испорченный курсор — 404 Invalid cursor, а не 500"""
+
+    @classmethod
+    def setUpTestData(cls):
+        _, products = seed_shop(categories=1, products_per_category=2)
+        cls.product = products[0]
+
+    def get(self, url, payload):
+        separator = "&" if "?" in url else "?"
+        return self.client.get(f"{url}{separator}cursor={encode_cursor(payload)}")
+
+    def assertInvalidCursor(self, url, payload):
+        response = self.get(url, payload)
+        self.assertEqual(response.status_code, 404, response.content)
+        self.assertEqual(response.json(), {"detail": "Invalid cursor"})
+
+    def test_product_list(self):
+        payloads = [
+            {"k": 5, "r": False},
+            {"k": ["abc"], "r": False},
+            {"k": [None], "r": False},
+            {"k": ["1", "2"], "r": False},
+            {"k": [str(2**70)], "r": False},
+            {"k": ["1"]},
+            ["1"],
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertInvalidCursor("/api/v1/products/", payload)
+        with self.subTest(ordering="price"):
+            self.assertInvalidCursor(
+                "/api/v1/products/?ordering=price", {"k": ["zz", "1"], "r": False}
+            )
+        response = self.client.get("/api/v1/products/", {"cursor": "не base64"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_review_feed(self):
+        url = f"/api/v1/products/{self.product.id}/reviews/"
+        for payload in ({"k": 5, "r": False}, {"k": ["вчера", "1"], "r": False}):
+            with self.subTest(payload=payload):
+                self.assertInvalidCursor(url, payload)
+
+    def test_valid_cursor(self):
+        response = self.get(
+            "/api/v1/products/?ordering=price", {"k": ["10.00", "0"], "r": False}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class RatingAggregatesTests(TestCase):
+    """Агрегаты рейтинга сходятся с пересчётом rebuild_ratings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, products = seed_shop(categories=1, products_per_category=2)
+        cls.product, cls.other = products
+
+    def setUp(self):
+        cache.clear()
+
+    def rebuild(self):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_ratings", stdout=out)
+        return out.getvalue()
+
+    def assertAggregatesConsistent(self):
+        self.assertIn("Обновлено товаров: 0", self.rebuild())
+
+    def test_edited_review(self):
+        review = self.product.reviews.first()
+        review.stars = 6 - review.stars
+        review.save()
+        self.assertAggregatesConsistent()
+
+    def test_moved_review(self):
+        review = self.product.reviews.first()
+        review.product = self.other
+        review.stars = 5
+        review.save()
+        self.assertAggregatesConsistent()
+        self.product.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.other.rating_count), (3, 5))
+
+    def test_deleted_review(self):
+        self.product.reviews.first().delete()
+        self.assertAggregatesConsistent()
+
+    def product_updates(self, action):
+        with CaptureQueriesContext(connection) as context:
+            action()
+        return [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('UPDATE "product_product"')
+        ]
+
+    def test_review_version_bump_shares_rating_update(self):
+        review = self.product.reviews.first()
+        review.stars = 6 - review.stars
+        self.assertEqual(len(self.product_updates(review.save)), 2)
+        review.text = "Исправленный текст"
+        self.assertEqual(len(self.product_updates(review.save)), 1)
+
+    def test_deleted_product_skips_review_aggregates(self):
+        self.assertEqual(self.product_updates(self.product.delete), [])
+        self.assertFalse(Review.objects.filter(product_id=self.product.id).exists())
+        self.assertAggregatesConsistent()
+
+    def reviews_total(self):
+        results = self.client.get("/api/v1/products/reviews/").json()["results"]
+        return next(p["reviews_total"] for p in results if p["id"] == self.product.id)
+
+    def test_rebuild_invalidates_cached_lists(self):
+        # Расхождение, которое чинит команда: запись мимо сигналов
+        Product.objects.filter(id=self.product.id).update(rating_count=0)
+        self.assertEqual(self.reviews_total(), 0)
+        self.assertIn("Обновлено товаров: 1", self.rebuild())
+        self.assertEqual(self.reviews_total(), 4)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class CategoryCountsTests(TestCase):
+    """Счётчики товаров сходятся с пересчётом rebuild_category_counts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, products = seed_shop(categories=2, products_per_category=2)
+        cls.product = products[0]
+        cls.category, cls.other = cls.product.category, products[-1].category
+
+    def setUp(self):
+        cache.clear()
+
+    def rebuild(self):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_category_counts", stdout=out)
+        return out.getvalue()
+
+    def assertCountsConsistent(self):
+        self.assertIn("Исправлено категорий: 0", self.rebuild())
+
+    def test_created_product(self):
+        Product.objects.create(
+            title="Новый", price=1, category=self.category, owner=self.owner
+        )
+        self.assertCountsConsistent()
+
+    def test_moved_product(self):
+        product = Product.objects.get(id=self.product.id)
+        product.category = self.other
+        product.save()
+        self.assertCountsConsistent()
+        counts = Category.objects.order_by("id").values_list("products_count")
+        self.assertEqual(list(counts), [(1,), (3,)])
+
+    def test_deleted_product(self):
+        Product.objects.get(id=self.product.id).delete()
+        self.assertCountsConsistent()
+
+    def products_count(self):
+        response = self.client.get("/api/v1/products/categories/")
+        results = response.json()["results"]
+        return next(c["products_count"] for c in results if c["id"] == self.category.id)
+
+    def test_rebuild_invalidates_cached_lists(self):
+        # Расхождение, которое чинит команда: запись мимо сигналов
+        Category.objects.filter(id=self.category.id).update(products_count=0)
+        self.assertEqual(self.products_count(), 0)
+        self.assertIn("Исправлено категорий: 1", self.rebuild())
+        self.assertEqual(self.products_count(), 2)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class ListCacheInvalidationTests(TestCase):
+    """Закэшированные списки видят новые агрегаты после коммита записи"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, products = seed_shop(categories=1, products_per_category=2)
+        cls.product = products[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def get_item(self, url, id):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return next(item for item in response.json()["results"] if item["id"] == id)
+
+    def test_review_changes_cached_rating_count(self):
+        url = "/api/v1/products/reviews/"
+        self.assertEqual(self.get_item(url, self.product.id)["reviews_total"], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                text="Новый", product=self.product, owner=self.owner, stars=5
+            )
+        self.assertEqual(self.get_item(url, self.product.id)["reviews_total"], 5)
+
+    def test_review_changes_cached_search(self):
+        url = "/api/v1/products/search/?q=Товар"
+        before = self.get_item(url, self.product.id)["updated_at"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                text="Новый", product=self.product, owner=self.owner, stars=5
+            )
+        self.assertNotEqual(self.get_item(url, self.product.id)["updated_at"], before)
+
+    def test_product_changes_cached_products_count(self):
+        url = "/api/v1/products/categories/"
+        category = self.product.category
+        self.assertEqual(self.get_item(url, category.id)["products_count"], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                title="Новый", price=1, category=category, owner=self.owner
+            )
+        self.assertEqual(self.get_item(url, category.id)["products_count"], 3)
+
+    def test_generation_changes_after_aggregates(self):
+        counts = []
+
+        def bump(model):
+            counts.append(Product.objects.get(id=self.product.id).rating_count)
+
+        with mock.patch("product.signals.bump_generation", bump):
+            with self.captureOnCommitCallbacks(execute=True):
+                Review.objects.create(
+                    text="Новый", product=self.product, owner=self.owner, stars=5
+                )
+                self.assertEqual(counts, [])
+        self.assertEqual(counts, [5])
+
+
+@override_settings(CACHES=DUMMY_CACHES, REPLICA_DATABASES=[])
+class FastReadPathTests(TestCase):
+    """Быстрый путь (values() + orjson) отдаёт те же байты, что сериализаторы"""
+
+    URLS = [
+        "/api/v1/products/",
+        "/api/v1/products/?page=2",
+        "/api/v1/products/?pagination=cursor&page_size=100&ordering=-price",
+        "/api/v1/products/?category=%(category)d&min_rating=2",
+        "/api/v1/products/my/?pagination=cursor&page_size=100",
+        "/api/v1/products/reviews/?pagination=cursor&page_size=100",
+        "/api/v1/products/reviews/?reviews_sort=top",
+        "/api/v1/products/search/?q=Товар",
+        "/api/v1/products/categories/",
+        "/api/v1/products/categories/?pagination=cursor&page_size=2",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, products = seed_shop(categories=3, products_per_category=5)
+        cls.category = products[0].category
+        # Неудобные значения: null, дробная цена, разделитель строк JS,
+        # кавычки и эмодзи, товар без отзывов
+        Product.objects.create(
+            title='Товар "кавычки" \u2028 😀',
+            description=None,
+            price="0.5",
+            category=cls.category,
+            owner=cls.owner,
+        )
+        Category.objects.create(name="Пустая \u2029 категория")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def fetch(self, url, fast):
+        with override_settings(FAST_READ_PATH=fast):
+            response = self.client.get(url % {"category": self.category.id})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_responses_are_byte_identical(self):
+        for time_zone in (settings.TIME_ZONE, "UTC"):
+            for url in self.URLS:
+                with self.subTest(url=url, time_zone=time_zone):
+                    with override_settings(TIME_ZONE=time_zone):
+                        fast = self.fetch(url, fast=True)
+                        slow = self.fetch(url, fast=False)
+                    self.assertEqual(fast.content, slow.content)
+                    self.assertTrue(fast.json()["results"])
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "price": Decimal("10.50"),
+            "created": datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+            "day": date(2024, 1, 2),
+            "text": "строка \u2028 \u2029 \x00 \"",
+            "lazy": gettext_lazy("Products"),
+            "nested": OrderedDict([("b", [1, 2.5, None, True])]),
+            "fragment": Fragment(b'{"id":1}'),
+        }
+        self.assertEqual(
+            ORJSONRenderer().render(data), FragmentJSONRenderer().render(data)
+        )
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    CACHE_STALE_TIMEOUT=60,
+    CACHE_EARLY_EXPIRATION_BETA=1.0,
+    CACHE_LOCK_WAIT=0.2,
+)
+class CacheStampedeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return "new"
+
+    def store(self, expires_in, delta=0.0):
+        entry = CacheEntry("old", time.time() + expires_in, delta)
+        cache.set("key", entry, timeout=120)
+
+    def test_fresh_value_is_not_recomputed(self):
+        self.assertEqual(get_or_compute("key", self.compute, 60), ("new", "miss"))
+        self.assertEqual(get_or_compute("key", self.compute, 60), ("new", "hit"))
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_is_served_while_another_process_refreshes(self):
+        self.store(expires_in=-1)
+        token = acquire_lock("key", 30)
+        self.assertEqual(get_or_compute("key", self.compute, 60), ("old", "stale"))
+        self.assertEqual(self.calls, 0)
+        release_lock("key", token)
+        self.assertEqual(get_or_compute("key", self.compute, 60), ("new", "refresh"))
+
+    def test_early_expiration_depends_on_recompute_time(self):
+        # -delta * log(1 - r): при r = 0 досрочного пересчёта нет,
+        # при r близком к 1 медленное значение пересчитывается заранее
+        self.store(expires_in=5, delta=10)
+        with mock.patch("common.cache.random.random", return_value=0.0):
+            self.assertEqual(get_or_compute("key", self.compute, 60), ("old", "hit"))
+        with mock.patch("common.cache.random.random", return_value=0.999):
+            self.assertEqual(
+                get_or_compute("key", self.compute, 60), ("new", "refresh")
+            )
+
+    def test_miss_waits_for_lock_holder(self):
+        token = acquire_lock("key", 30)
+        Timer(0.05, self.store, kwargs={"expires_in": 60}).start()
+        self.assertEqual(get_or_compute("key", self.compute, 60), ("old", "hit"))
+        # Держатель блокировки так и не записал значение — считаем сами
+        cache.delete("key")
+        self.assertEqual(get_or_compute("key", self.compute, 60), ("new", "miss"))
+        self.assertEqual(self.calls, 1)
+        release_lock("key", token)
+
+    @override_settings(CACHE_LOCK_WAIT=5)
+    def test_concurrent_misses_compute_once(self):
+        barrier = Barrier(8)
+
+        def slow_compute():
+            time.sleep(0.2)
+            return self.compute()
+
+        def request(_):
+            barrier.wait()
+            return get_or_compute("key", slow_compute, 60)[0]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(request, range(8)))
+        self.assertEqual(results, ["new"] * 8)
+        self.assertEqual(self.calls, 1)
+
+
+@override_settings(CACHES=DUMMY_CACHES, REPLICA_DATABASES=[])
+class LoadSheddingTests(TestCase):
+    """429 от token bucket и 503 от ConcurrencyLimitMiddleware"""
+
+    url = "/api/v1/products/categories/"
+
+    def setUp(self):
+        Category.objects.create(name="Категория")
+
+    def throttled(self, count):
+        return [self.client.get(self.url).status_code for _ in range(count)]
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"default_anon": "2/min"},
+        }
+    )
+    def test_throttled_request_gets_retry_after(self):
+        self.assertEqual(self.throttled(2), [200, 200])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        # Токен копится 30 с при 2 запросах в минуту
+        self.assertTrue(0 < int(response["Retry-After"]) <= 30)
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"default_anon": "2/min"},
+        }
+    )
+    def test_local_buckets_when_redis_is_down(self):
+        redis = mock.Mock()
+        redis.eval.side_effect = RedisError
+        with mock.patch("common.throttling.get_redis", return_value=redis):
+            self.assertEqual(self.throttled(3), [200, 200, 429])
+        # После ошибки Redis не опрашивается REDIS_RETRY_INTERVAL секунд
+        redis.eval.assert_called_once()
+
+    @override_settings(
+        MAX_IN_FLIGHT_REQUESTS=1,
+        OVERLOAD_RETRY_AFTER=3,
+        REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+    )
+    def test_overloaded_process_sheds_requests(self):
+        nested = []
+        original = CategoryListCreateAPIView.list
+
+        def list_with_nested_request(view, request, *args, **kwargs):
+            # Первый запрос ещё обрабатывается, второй в лимит не влезает
+            nested.append(self.client.get(self.url))
+            return original(view, request, *args, **kwargs)
+
+        with mock.patch.object(
+            CategoryListCreateAPIView, "list", list_with_nested_request
+        ):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(nested[0].status_code, 503)
+        self.assertEqual(nested[0]["Retry-After"], "3")
+        # Слот освобождён
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_shop(categories=1, products_per_category=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def lookups(self, cache_name):
+        return {
+            result: self.sample("cache_lookups_total", cache=cache_name, result=result)
+            for result in ("hit", "miss")
+        }
+
+    def test_cache_lookups_are_counted(self):
+        lists = self.lookups("product_list")
+        fragments = self.lookups("fragment:product")
+        for _ in range(2):
+            self.assertEqual(self.client.get("/api/v1/products/").status_code, 200)
+        # Второй запрос отдан из кэша списка, фрагменты не читались
+        self.assertEqual(
+            self.lookups("product_list"),
+            {"hit": lists["hit"] + 1, "miss": lists["miss"] + 1},
+        )
+        self.assertEqual(
+            self.lookups("fragment:product"),
+            {"hit": fragments["hit"], "miss": fragments["miss"] + 2},
+        )
+
+    def test_metrics_endpoint(self):
+        labels = {"method": "GET", "route": "api/v1/products/", "status": "200"}
+        before = self.sample("http_request_duration_seconds_count", **labels)
+        self.client.get("/api/v1/products/")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE_LATEST)
+        self.assertIn(b"cache_lookups_total{", response.content)
+        series = b'http_request_db_queries_count{route="api/v1/products/"}'
+        self.assertIn(series, response.content)
+        self.assertEqual(
+            self.sample("http_request_duration_seconds_count", **labels), before + 1
+        )
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REPLICA_DATABASES=["replica"],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class ReplicaPinTests(TestCase):
+    """Реплику не подключаем: важно лишь, пошёл ли запрос на неё"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser("admin@example.com", "admin")
+        cls.category = Category.objects.create(name="Посуда")
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("common.db_router.choose_replica", return_value=None)
+        self.choose_replica = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reads_replica(self, url):
+        self.choose_replica.reset_mock()
+        self.assertEqual(APIClient().get(url).status_code, 200)
+        return self.choose_replica.called
+
+    def test_write_pins_only_lists_of_written_model(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.put(
+                f"/api/v1/products/categories/{self.category.id}/", {"name": "Кухня"}
+            )
+        self.assertEqual(response.status_code, 200)
+        # Поиск от категорий не зависит: запись админа его не прижимает
+        self.assertTrue(self.reads_replica("/api/v1/products/search/?q=чайник"))
+        self.assertFalse(self.reads_replica("/api/v1/products/categories/"))
+
+
+@skipUnless(settings.REPLICA_DATABASES, "запустите с DB_REPLICAS=replica.sqlite3")
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplicaRoutingTests(TestCase):
+    """Реплика — отдельная тестовая БД, поэтому видно, откуда пришли данные"""
+
+    databases = {"default", *settings.REPLICA_DATABASES}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.replica = settings.REPLICA_DATABASES[0]
+        cls.owner = CustomUser.objects.create_user("owner@example.com", "owner")
+        cls.category = Category.objects.create(name="На primary")
+        Category.objects.using(cls.replica).create(name="На реплике")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def category_names(self):
+        response = self.client.get("/api/v1/products/categories/")
+        return [category["name"] for category in response.data["results"]]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.category_names(), ["На реплике"])
+
+    def test_user_reads_own_writes_from_primary(self):
+        response = self.client.post(
+            "/api/v1/products/",
+            {"title": "Новый", "price": 10, "category": self.category.id},
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        response = self.client.get("/api/v1/products/my/")
+        self.assertEqual([p["title"] for p in response.json()["results"]], ["Новый"])
+        self.assertEqual(self.category_names(), ["На primary"])
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        connection = connections[self.replica]
+        with mock.patch.object(
+            connection, "ensure_connection", side_effect=OperationalError
+        ), mock.patch.dict("common.db_router._replica_down_until"):
+            self.assertEqual(self.category_names(), ["На primary"])
@@ -1,18 +1,35 @@
 from django.urls import path
+
+from . import async_views
 from .views import (
     CategoryListCreateAPIView,
     CategoryDetailAPIView,
     ProductListCreateAPIView,
     ProductDetailAPIView,
     ProductWithReviewsAPIView,
+    ProductReviewListAPIView,
     OwnerProductListAPIView,
+    ProductSearchAPIView,
+    ProductBulkAPIView,
+    ProductExportAPIView,
 )
 
 urlpatterns = [
     path("", ProductListCreateAPIView.as_view()),
     path("<int:id>/", ProductDetailAPIView.as_view()),
+    path(
+        "<int:id>/reviews/",
+        ProductReviewListAPIView.as_view(),
+        name="product-reviews",
+    ),
     path("categories/", CategoryListCreateAPIView.as_view()),
     path("categories/<int:id>/", CategoryDetailAPIView.as_view()),
     path("reviews/", ProductWithReviewsAPIView.as_view()),
     path("my/", OwnerProductListAPIView.as_view()),
+    path("search/", ProductSearchAPIView.as_view()),
+    path("bulk/", ProductBulkAPIView.as_view()),
+    path("export/", ProductExportAPIView.as_view()),
+    path("async/", async_views.product_list),
+    path("async/<int:id>/", async_views.product_detail),
+    path("async/reviews/", async_views.product_with_reviews_list),
 ]
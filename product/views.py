@@ -1,15 +1,22 @@
-from collections import OrderedDict
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.generics import (
+    GenericAPIView,
     ListCreateAPIView,
     RetrieveUpdateDestroyAPIView,
     ListAPIView,
 )
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from users.authentication import CachedJWTAuthentication
 
 
 from .models import Category, Product, Review
@@ -20,35 +27,41 @@ from .serializers import (
     ProductWithReviewsSerializer,
     CategoryValidateSerializer,
     ProductValidateSerializer,
+    ProductBulkValidateSerializer,
+    ProductBulkUpdateValidateSerializer,
+    ProductExportValidateSerializer,
     ReviewValidateSerializer,
 )
+from common.cache import bump_generation
 from common.permissions import IsOwner, IsAnonymousReadOnly, IsStaff, IsSuperuser
-from django.core.cache import cache
-
-PAGE_SIZE = 5
-
-
-class CustomPagination(PageNumberPagination):
-    def get_paginated_response(self, data):
-        return Response(
-            OrderedDict(
-                [
-                    ("total", self.page.paginator.count),
-                    ("next", self.get_next_link()),
-                    ("previous", self.get_previous_link()),
-                    ("results", data),
-                ]
-            )
-        )
-
-    def get_page_size(self, request):
-        return PAGE_SIZE
-
-
-class CategoryListCreateAPIView(ListCreateAPIView):
+from common.cache import CachedListMixin
+from common.conditional import ConditionalListMixin, ConditionalObjectMixin
+from common.db_router import ReplicaReadMixin, get_read_database
+from common.pagination import CustomPagination, KeysetPagination
+from .search import search_products
+from .filters import ProductFilterBackend, facets_requested, get_product_facets
+from .fragments import FRAGMENTS, FragmentListMixin, mark_dirty
+from .reviews import REVIEW_KEYSET_ORDERINGS, get_review_sort, top_reviews_prefetch
+from .rows import CATEGORY_ROWS, RowListMixin
+from .export import EXPORT_FORMATS, iter_rows
+
+PRODUCT_KEYSET_ORDERINGS = {
+    "id": ("id",),
+    "-id": ("-id",),
+    "price": ("price", "id"),
+    "-price": ("-price", "-id"),
+}
+
+
+class CategoryListCreateAPIView(
+    ReplicaReadMixin, CachedListMixin, RowListMixin, ListCreateAPIView
+):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    row_format = CATEGORY_ROWS
     pagination_class = CustomPagination
+    cache_prefix = "category_list"
+    cache_models = (Category, Product)
 
     def get_permissions(self):
         if self.request.method == "GET":
@@ -64,7 +77,9 @@ class CategoryListCreateAPIView(ListCreateAPIView):
         )
 
 
-class CategoryDetailAPIView(RetrieveUpdateDestroyAPIView):
+class CategoryDetailAPIView(
+    ReplicaReadMixin, ConditionalObjectMixin, RetrieveUpdateDestroyAPIView
+):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     lookup_field = "id"
@@ -76,30 +91,43 @@ class CategoryDetailAPIView(RetrieveUpdateDestroyAPIView):
         serializer.is_valid(raise_exception=True)
 
         instance.name = serializer.validated_data.get("name")
-        instance.save()
+        instance.save(update_fields=["name", "updated_at"])
 
         return Response(CategorySerializer(instance).data)
 
 
-class ProductListCreateAPIView(ListCreateAPIView):
+class ProductListCreateAPIView(
+    ReplicaReadMixin, CachedListMixin, FragmentListMixin, ListCreateAPIView
+):
+    throttle_scope = "products"
     queryset = Product.objects.select_related("category").all()
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
     permission_classes = [IsOwner | IsAnonymousReadOnly | IsStaff]
     authentication_classes = [
-        JWTAuthentication
+        CachedJWTAuthentication
     ]  # Assuming no authentication for simplicity
+    keyset_orderings = PRODUCT_KEYSET_ORDERINGS
+    filter_backends = [ProductFilterBackend]
+    cache_prefix = "product_list"
+    cache_models = (Product, Category, Review)
 
-    def get(self, request, *args, **kwargs):
-        cached_data = cache.get("product_list")
-        if cached_data:
-            return Response(data=cached_data, status=status.HTTP_200_OK)
-        paginator = CustomPagination()
-        products = Product.objects.select_related("category").prefetch_related("reviews").all()
-        result_page = paginator.paginate_queryset(products, request)
-        serializer = ProductSerializer(result_page, many=True)
-        cache.set("product_list", serializer.data, timeout=60 * 15)  # Cache for 15 minutes
-        return paginator.get_paginated_response(serializer.data)
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["facets"] = None
+        if self.wants_facets():
+            response.data["facets"] = get_product_facets(
+                self.filter_queryset(self.get_queryset())
+            )
+        return response
+
+    def wants_facets(self):
+        params = self.request.query_params
+        if self.paginator.keyset is not None:
+            first_page = KeysetPagination.cursor_query_param not in params
+        else:
+            first_page = self.paginator.page.number == 1
+        return facets_requested(params, first_page)
 
     def post(self, request, *args, **kwargs):
         serializer = ProductValidateSerializer(data=request.data)
@@ -125,7 +153,9 @@ class ProductListCreateAPIView(ListCreateAPIView):
         )
 
 
-class ProductDetailAPIView(RetrieveUpdateDestroyAPIView):
+class ProductDetailAPIView(
+    ReplicaReadMixin, ConditionalObjectMixin, RetrieveUpdateDestroyAPIView
+):
     queryset = Product.objects.select_related("category").all()
     serializer_class = ProductSerializer
     lookup_field = "id"
@@ -140,12 +170,143 @@ class ProductDetailAPIView(RetrieveUpdateDestroyAPIView):
         product.description = serializer.validated_data.get("description")
         product.price = serializer.validated_data.get("price")
         product.category = serializer.validated_data.get("category")
-        product.save()
+        # Счётчики обновляются F()-выражениями, не перезаписываем их
+        product.save(
+            update_fields=["title", "description", "price", "category", "updated_at"]
+        )
 
         return Response(data=ProductSerializer(product).data)
 
 
-class ReviewViewSet(ModelViewSet):
+class ProductExportAPIView(ReplicaReadMixin, APIView):
+    """Потоковая выгрузка каталога в NDJSON или CSV с постоянным расходом памяти"""
+
+    permission_classes = [IsOwner | IsAnonymousReadOnly | IsStaff]
+
+    def get(self, request, *args, **kwargs):
+        serializer = ProductExportValidateSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        output = serializer.validated_data["output"]
+        updated_since = serializer.validated_data.get("updated_since")
+
+        render, content_type = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(
+            # Поток читается после выхода из view, базу чтения передаём явно
+            render(iter_rows(updated_since, using=get_read_database())),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="products.{output}"'
+        return response
+
+
+class ProductBulkAPIView(ReplicaReadMixin, GenericAPIView):
+    """POST создаёт, PUT обновляет массив товаров одной транзакцией.
+    Ошибки возвращаются по каждому элементу, не прерывая всю пачку"""
+
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    permission_classes = [IsOwner | IsStaff]
+    update_fields = ["title", "description", "price", "category", "updated_at"]
+
+    def post(self, request, *args, **kwargs):
+        return self.bulk_write(request, ProductBulkValidateSerializer)
+
+    def put(self, request, *args, **kwargs):
+        return self.bulk_write(request, ProductBulkUpdateValidateSerializer)
+
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a non-empty list of products")
+        if len(items) > settings.BULK_MAX_ITEMS:
+            raise ValidationError(
+                f"Too many products, maximum is {settings.BULK_MAX_ITEMS}"
+            )
+        return items
+
+    def bulk_write(self, request, validate_serializer_class):
+        items = self.get_items(request)
+        results = [None] * len(items)
+
+        validated = {}
+        for index, item in enumerate(items):
+            serializer = validate_serializer_class(data=item)
+            if serializer.is_valid():
+                validated[index] = serializer.validated_data
+            else:
+                results[index] = {"status": 400, "errors": serializer.errors}
+
+        categories = Category.objects.in_bulk(
+            {data["category"] for data in validated.values()}
+        )
+        products = {}
+        if validate_serializer_class is ProductBulkUpdateValidateSerializer:
+            products = Product.objects.in_bulk(
+                {data["id"] for data in validated.values()}
+            )
+
+        to_create, to_update = {}, {}
+        for index, data in validated.items():
+            category = categories.get(data["category"])
+            if category is None:
+                results[index] = {
+                    "status": 400,
+                    "errors": {"category": ["Category does not exist"]},
+                }
+                continue
+            values = {**data, "category": category}
+            if "id" not in data:
+                to_create[index] = Product(owner=request.user, **values)
+                continue
+            product = products.get(values.pop("id"))
+            if product is None:
+                results[index] = {"status": 404, "errors": {"id": ["Not found."]}}
+                continue
+            try:
+                self.check_object_permissions(request, product)
+            except PermissionDenied as exc:
+                results[index] = {"status": 403, "errors": {"detail": exc.detail}}
+                continue
+            for name, value in values.items():
+                setattr(product, name, value)
+            to_update[index] = product
+
+        self.save_products(to_create.values(), to_update.values())
+
+        for index, product in to_create.items():
+            results[index] = {"status": 201, "data": ProductSerializer(product).data}
+        for index, product in to_update.items():
+            results[index] = {"status": 200, "data": ProductSerializer(product).data}
+        return Response(
+            {"created": len(to_create), "updated": len(to_update), "results": results}
+        )
+
+    def save_products(self, to_create, to_update):
+        # bulk_create/bulk_update не шлют сигналы, поэтому счётчики
+        # и поколение кэша обновляются здесь
+        deltas = Counter()
+        for product in to_create:
+            deltas[product.category_id] += 1
+        now = timezone.now()
+        for product in to_update:
+            deltas[product._loaded_category_id] -= 1
+            deltas[product.category_id] += 1
+            product._loaded_category_id = product.category_id
+            product.updated_at = now
+
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create)
+            Product.objects.bulk_update(to_update, self.update_fields)
+            Category.apply_products_counts(deltas)
+        if to_create or to_update:
+            transaction.on_commit(partial(bump_generation, Product))
+            mark_dirty([product.pk for product in [*to_create, *to_update]])
+
+
+# Не подключён в urls.py, как и в исходном проекте: путь reviews/ занят
+# лентой товаров с отзывами, а открыть запись отзывов через API — отдельное
+# решение. Отзывы товара читаются через ProductReviewListAPIView
+class ReviewViewSet(ReplicaReadMixin, ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     pagination_class = CustomPagination
@@ -184,22 +345,84 @@ class ReviewViewSet(ModelViewSet):
         return Response(data=ReviewSerializer(review).data)
 
 
-class ProductWithReviewsAPIView(APIView):
-    def get(self, request):
-        paginator = CustomPagination()
-        products = (
-            Product.objects.select_related("category").prefetch_related("reviews").all()
+class ProductWithReviewsAPIView(
+    ReplicaReadMixin, CachedListMixin, FragmentListMixin, ListAPIView
+):
+    """Товары с NESTED_REVIEWS_LIMIT последними (?reviews_sort=newest)
+    или лучшими (?reviews_sort=top) отзывами; все — по reviews_url"""
+
+    throttle_scope = "products"
+    serializer_class = ProductWithReviewsSerializer
+    pagination_class = CustomPagination
+    keyset_orderings = PRODUCT_KEYSET_ORDERINGS
+    cache_prefix = "product_reviews_list"
+    cache_models = (Product, Category, Review)
+
+    def get_queryset(self):
+        return Product.objects.select_related("category").prefetch_related(
+            top_reviews_prefetch(get_review_sort(self.request))
         )
-        result_page = paginator.paginate_queryset(products, request)
 
-        serializer = ProductWithReviewsSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+    def get_fragment_spec(self):
+        return FRAGMENTS[f"product_with_{get_review_sort(self.request)}_reviews"]
+
+
+class ProductReviewListAPIView(ReplicaReadMixin, ConditionalListMixin, ListAPIView):
+    """Все отзывы товара с keyset-пагинацией: ?ordering=-created (по умолчанию),
+    -stars или stars; ?pagination=page — постранично.
+
+    Запись отзыва меняет updated_at товара, он и служит версией ленты"""
+
+    throttle_scope = "products"
+    serializer_class = ReviewSerializer
+    pagination_class = CustomPagination
+    pagination_mode = "cursor"
+    keyset_orderings = REVIEW_KEYSET_ORDERINGS
+    permission_classes = [IsAnonymousReadOnly]
+
+    def get_queryset(self):
+        # Порядок задаёт пагинация, для ?pagination=page — по умолчанию
+        return Review.objects.filter(product_id=self.kwargs["id"]).order_by(
+            *REVIEW_KEYSET_ORDERINGS["-created"]
+        )
+
+    def get_list_version(self):
+        product = Product.objects.filter(id=self.kwargs["id"])
+        version = product.values_list("updated_at", flat=True).first()
+        if version is None:
+            raise NotFound("No Product matches the given query.")
+        return version
+
+
+class ProductSearchAPIView(
+    ReplicaReadMixin, CachedListMixin, FragmentListMixin, ListAPIView
+):
+    throttle_scope = "products"
+    serializer_class = ProductSerializer
+    pagination_class = CustomPagination
+    # Только постранично: выдача упорядочена по рангу, а не по полям модели
+    keyset_orderings = None
+    cache_prefix = "product_search"
+    # Отзывы пишут товар через update() без сигналов Product
+    cache_models = (Product, Review)
+
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "Query is required"})
+        return search_products(Product.objects.all(), query)
 
 
-class OwnerProductListAPIView(ListAPIView):
+class OwnerProductListAPIView(
+    ReplicaReadMixin, CachedListMixin, FragmentListMixin, ListAPIView
+):
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
     permission_classes = [IsOwner | IsStaff]
+    keyset_orderings = PRODUCT_KEYSET_ORDERINGS
+    cache_prefix = "owner_product_list"
+    cache_models = (Product, Category, Review)
+    cache_per_user = True
 
     def get_queryset(self):
         return Product.objects.select_related("category").filter(
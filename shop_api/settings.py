@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "common.metrics.MetricsMiddleware",
+    "common.middleware.ConcurrencyLimitMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -66,15 +68,57 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
         # 'rest_framework.authentication.SessionAuthentication',
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ],
     # "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+    "DEFAULT_THROTTLE_CLASSES": ["common.throttling.TokenBucketThrottle"],
+    # Скоуп задаётся во view через throttle_scope, "<scope>_anon" — для анонимов
+    "DEFAULT_THROTTLE_RATES": {
+        "default": "600/min",
+        "default_anon": "120/min",
+        "products": "300/min",
+        "products_anon": "60/min",
+        "auth": "10/min",
+    },
 }
 
+# Одновременных запросов на процесс, сверх — 503; None отключает лимит
+MAX_IN_FLIGHT_REQUESTS = 64
+OVERLOAD_RETRY_AFTER = 1
+
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/2'
 CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/2'
+LAST_LOGIN_FLUSH_INTERVAL = 5
+BLACKLIST_SYNC_INTERVAL = 60 * 15
+# Флаг «зеркало полное» живёт два цикла синхронизации: если запись jti
+# в Redis потерялась, дольше этого срока зеркалу не доверяем
+BLACKLIST_SYNCED_TIMEOUT = BLACKLIST_SYNC_INTERVAL * 2
+# shop_api не входит в INSTALLED_APPS, autodiscover его задачи не найдёт
+CELERY_IMPORTS = ["shop_api.tasks"]
+CELERY_BEAT_SCHEDULE = {
+    "purge-expired-tokens": {
+        "task": "shop_api.tasks.purge_expired_tokens",
+        "schedule": 60 * 60,
+    },
+    "sync-token-blacklist": {
+        "task": "shop_api.tasks.sync_token_blacklist",
+        "schedule": BLACKLIST_SYNC_INTERVAL,
+    },
+    "flush-last-logins": {
+        "task": "shop_api.tasks.flush_last_logins",
+        "schedule": LAST_LOGIN_FLUSH_INTERVAL,
+    },
+    "drain-confirmation-outbox": {
+        "task": "shop_api.tasks.drain_confirmation_outbox",
+        "schedule": 2,
+    },
+    "rebuild-product-fragments": {
+        "task": "shop_api.tasks.rebuild_product_fragments",
+        "schedule": 5,
+    },
+}
 
 QUERYCOUNT = {
     "THRESHOLDS": {
@@ -112,12 +156,43 @@ WSGI_APPLICATION = "shop_api.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Без DB_NAME — локальный SQLite. DB_REPLICAS — реплики через запятую:
+# для Postgres "host" или "host/name", для SQLite пути к файлам
+def database_config(host=None, name=None):
+    if not os.environ.get("DB_NAME"):
+        return {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": name or BASE_DIR / "db.sqlite3",
+        }
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": name or os.environ["DB_NAME"],
+        "USER": os.environ.get("DB_USER"),
+        "PASSWORD": os.environ.get("DB_PASSWORD"),
+        "HOST": host or os.environ.get("DB_HOST", "db"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        # Постоянные соединения; перед повторным использованием проверяются
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
-}
+
+
+DATABASES = {"default": database_config()}
+DB_REPLICAS = [item.strip() for item in os.environ.get("DB_REPLICAS", "").split(",")]
+for index, replica in enumerate(filter(None, DB_REPLICAS)):
+    if os.environ.get("DB_NAME"):
+        replica_host, _, replica_name = replica.partition("/")
+        DATABASES[f"replica_{index}"] = database_config(replica_host, replica_name)
+    else:
+        DATABASES[f"replica_{index}"] = database_config(name=replica)
+
+DATABASE_ROUTERS = ["common.db_router.ReplicaRouter"]
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != "default"]
+# Сколько секунд после записи пользователь читает с primary:
+# реплика может ещё не получить его изменения
+REPLICA_STICKY_SECONDS = 5
+# Сколько секунд не ходить на реплику, к которой не удалось подключиться
+REPLICA_RETRY_INTERVAL = 10
 
 CACHES = {
     "default": {
@@ -129,6 +204,39 @@ CACHES = {
     }
 }
 
+LIST_CACHE_TIMEOUT = 60 * 15
+# Защита от лавины пересчётов (common.cache.get_or_compute): после
+# мягкого срока значение ещё CACHE_STALE_TIMEOUT отдаётся, пока один
+# процесс под блокировкой его пересчитывает
+CACHE_STALE_TIMEOUT = 60
+CACHE_EARLY_EXPIRATION_BETA = 1.0
+CACHE_LOCK_TIMEOUT = 30
+# Сколько ждать чужого пересчёта при полном промахе, прежде чем считать самим
+CACHE_LOCK_WAIT = 2
+
+# Фрагменты версионированы, устаревшие просто дожидаются истечения
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Списки строятся из values() и рендерятся orjson (product.rows)
+FAST_READ_PATH = os.environ.get("FAST_READ_PATH") == "on"
+
+AUTH_USER_CACHE = {
+    "TTL": 60 * 5,
+    # Процессный LRU нельзя сбросить из другого воркера, поэтому TTL короткий
+    "LOCAL_TTL": 5,
+    "LOCAL_MAXSIZE": 10000,
+}
+
+MAX_PAGE_SIZE = 100
+# Сколько отзывов вкладывать в товар в /products/reviews/
+NESTED_REVIEWS_LIMIT = 3
+
+PRICE_FACET_BOUNDS = [0, 50, 100, 250, 500]
+
+BULK_MAX_ITEMS = 500
+
+EXPORT_CHUNK_SIZE = 2000
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -172,9 +280,24 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=3),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
-    "UPDATE_LAST_LOGIN": True,
+    # last_login пишется пачками задачей flush_last_logins, см. users/last_login.py
+    "UPDATE_LAST_LOGIN": False,
     "SIGNING_KEY": os.environ.get("SECRET"),
     "TOKEN_OBTAIN_SERIALIZER": "users.serializers.CustomToken",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.CustomTokenRefresh",
+}
+
+GOOGLE_OAUTH = {
+    "CLIENT_ID": os.environ.get("GOOGLE_CLIENT_ID"),
+    "CLIENT_SECRET": os.environ.get("GOOGLE_CLIENT_SECRET"),
+    "REDIRECT_URI": "http://localhost:8000/api/v1/users/google-login",
+    "TOKEN_URL": "https://oauth2.googleapis.com/token",
+    "JWKS_URL": "https://www.googleapis.com/oauth2/v3/certs",
+    "TIMEOUT": (3.05, 5),  # (connect, read) в секундах
+    "RETRIES": 2,
+    "POOL_SIZE": 20,
+    "JWKS_TTL": 60 * 60,
+    "JWKS_MIN_REFRESH": 30,
 }
 
 # Internationalization
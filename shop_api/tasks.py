@@ -1,5 +1,120 @@
+import json
+from datetime import datetime
+from smtplib import SMTPException
+
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import send_mass_mail
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+from common.cache import get_redis
+from product import fragments
+from users import last_login
+from users.models import CONFIRMATION_OUTBOX_KEY
+from users.tokens import BLACKLIST_SYNCED_KEY, MIRROR_ERRORS, mirror_blacklisted
+
 
 @shared_task
 def send_hello_email(email):
-    print(f'Привет отправлен на {email}')
\ No newline at end of file
+    print(f'Привет отправлен на {email}')
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+@shared_task
+def purge_expired_tokens(batch_size=5000):
+    """Удаляет истёкшие blacklisted и outstanding токены пачками"""
+    now = timezone.now()
+    blacklisted = _delete_in_batches(
+        BlacklistedToken.objects.filter(token__expires_at__lt=now), batch_size
+    )
+    outstanding = _delete_in_batches(
+        OutstandingToken.objects.filter(expires_at__lt=now), batch_size
+    )
+    return {"blacklisted": blacklisted, "outstanding": outstanding}
+
+
+@shared_task
+def sync_token_blacklist(batch_size=5000):
+    """Восстанавливает зеркало чёрного списка в Redis из БД"""
+    rows = (
+        BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        .values_list("token__jti", "token__expires_at")
+        .iterator(chunk_size=batch_size)
+    )
+    for jti, expires_at in rows:
+        mirror_blacklisted(jti, expires_at)
+    cache.set(BLACKLIST_SYNCED_KEY, True, timeout=settings.BLACKLIST_SYNCED_TIMEOUT)
+
+
+@shared_task(autoretry_for=MIRROR_ERRORS, retry_backoff=True, max_retries=5)
+def mirror_blacklisted_token(jti, expires_at):
+    """Повторяет запись jti в зеркало, если при коммите Redis был недоступен"""
+    mirror_blacklisted(jti, datetime.fromisoformat(expires_at))
+
+
+@shared_task
+def flush_last_logins():
+    return last_login.flush_last_logins()
+
+
+@shared_task(
+    autoretry_for=(SMTPException, OSError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_confirmation_codes(messages):
+    """Отправляет пачку кодов подтверждения через одно SMTP-соединение"""
+    send_mass_mail(
+        [
+            (
+                "Код подтверждения",
+                f"Ваш код подтверждения: {code}",
+                settings.DEFAULT_FROM_EMAIL,
+                [email],
+            )
+            for email, code in messages
+        ],
+        fail_silently=False,
+    )
+    return len(messages)
+
+
+@shared_task
+def drain_confirmation_outbox(batch_size=500):
+    redis = get_redis()
+    if redis is None:
+        return 0
+    drained = 0
+    while True:
+        with redis.pipeline() as pipe:
+            pipe.lrange(CONFIRMATION_OUTBOX_KEY, 0, batch_size - 1)
+            pipe.ltrim(CONFIRMATION_OUTBOX_KEY, batch_size, -1)
+            items, _ = pipe.execute()
+        if not items:
+            return drained
+        send_confirmation_codes.delay([json.loads(item) for item in items])
+        drained += len(items)
+
+
+@shared_task
+def rebuild_product_fragments(batch_size=1000):
+    """Прогревает фрагменты товаров, изменённых с прошлого запуска"""
+    warmed = 0
+    while True:
+        product_ids, category_ids = fragments.take_dirty(batch_size)
+        if not product_ids and not category_ids:
+            return warmed
+        warmed += fragments.warm_fragments(product_ids, category_ids)
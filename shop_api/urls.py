@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 from . import swagger
+from common.metrics import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/products/", include("product.urls")),
     path("api/v1/users/", include("users.urls")),
+    path("metrics", metrics_view),
 ]
 
 urlpatterns += swagger.urlpatterns
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from common.cache import LocalLRUCache
+from common.metrics import record_cache
+from users.models import CustomUser
+
+SNAPSHOT_FIELD_NAMES = {
+    "id",
+    "email",
+    "username",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+    "birthday",
+}
+# Поля снимка в порядке модели (этого ждёт from_db);
+# остальные поля загружаются лениво при обращении
+SNAPSHOT_FIELDS = tuple(
+    field.attname
+    for field in CustomUser._meta.concrete_fields
+    if field.attname in SNAPSHOT_FIELD_NAMES
+)
+USER_KEY = "auth:user:{}"
+TOKEN_KEY = "auth:token:{}"
+
+_local = None
+
+
+def get_local_cache():
+    global _local
+    if _local is None:
+        config = settings.AUTH_USER_CACHE
+        _local = LocalLRUCache(config["LOCAL_MAXSIZE"], config["LOCAL_TTL"])
+    return _local
+
+
+@receiver(setting_changed)
+def reset_local_cache(setting=None, **kwargs):
+    global _local
+    if setting in ("AUTH_USER_CACHE", "CACHES"):
+        _local = None
+
+
+def _lookup(key, load):
+    """Процессный LRU, затем общий кэш (Redis), затем БД"""
+    name = key.rsplit(":", 1)[0]
+    local = get_local_cache()
+    value = local.get(key)
+    if value is not None:
+        record_cache(name, "local_hit")
+        return value
+    value = cache.get(key)
+    record_cache(name, "miss" if value is None else "hit")
+    if value is None:
+        value = load()
+        if value is None:
+            return None
+        cache.set(key, value, timeout=settings.AUTH_USER_CACHE["TTL"])
+    local.set(key, value)
+    return value
+
+
+def _load_snapshot(user_id):
+    return (
+        CustomUser.objects.filter(id=user_id).values_list(*SNAPSHOT_FIELDS).first()
+    )
+
+
+def get_cached_user(user_id):
+    """Возвращает CustomUser из снимка: пригоден для FK и сравнений,
+    остальные поля (например, password) подгружаются по требованию"""
+    values = _lookup(USER_KEY.format(user_id), lambda: _load_snapshot(user_id))
+    if values is None:
+        return None
+    return CustomUser.from_db("default", SNAPSHOT_FIELDS, values)
+
+
+def get_cached_token_user_id(key):
+    return _lookup(
+        TOKEN_KEY.format(key),
+        lambda: Token.objects.filter(key=key).values_list("user_id", flat=True).first(),
+    )
+
+
+def invalidate_user(user_id):
+    key = USER_KEY.format(user_id)
+    get_local_cache().delete(key)
+    cache.delete(key)
+
+
+def invalidate_token(key):
+    key = TOKEN_KEY.format(key)
+    get_local_cache().delete(key)
+    cache.delete(key)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise exceptions.AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            )
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+        return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        user_id = get_cached_token_user_id(key)
+        user = get_cached_user(user_id) if user_id is not None else None
+        if user is None:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,79 @@
+"""Буферизация last_login: вместо UPDATE на каждую выдачу токена
+отметки копятся в Redis (или в памяти процесса) и сбрасываются
+одним UPDATE периодической задачей"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from redis.exceptions import ResponseError
+
+from common.cache import get_redis
+from users.models import CustomUser
+
+PENDING_KEY = "last_login:pending"
+
+_local_pending = {}
+_local_lock = threading.Lock()
+_local_flushed_at = time.monotonic()
+
+
+def record_login(user_id, when=None):
+    when = when or time.time()
+    redis = get_redis()
+    if redis is not None:
+        redis.hset(PENDING_KEY, user_id, when)
+        return
+
+    global _local_flushed_at
+    with _local_lock:
+        _local_pending[user_id] = max(when, _local_pending.get(user_id, 0))
+        due = time.monotonic() - _local_flushed_at >= settings.LAST_LOGIN_FLUSH_INTERVAL
+    if due:
+        flush_last_logins()
+
+
+def _take_pending():
+    redis = get_redis()
+    if redis is None:
+        global _local_flushed_at
+        with _local_lock:
+            pending = dict(_local_pending)
+            _local_pending.clear()
+            _local_flushed_at = time.monotonic()
+        return pending
+
+    # RENAME атомарен: новые входы попадут в свежий хеш, а не потеряются
+    processing_key = f"{PENDING_KEY}:{uuid.uuid4().hex}"
+    try:
+        redis.rename(PENDING_KEY, processing_key)
+    except ResponseError:
+        # Ключа нет: с прошлого сброса входов не было
+        return {}
+    pending = {
+        int(user_id): float(when)
+        for user_id, when in redis.hgetall(processing_key).items()
+    }
+    redis.delete(processing_key)
+    return pending
+
+
+def flush_last_logins(batch_size=1000):
+    """Записывает накопленные отметки одним UPDATE на пачку"""
+    pending = sorted(_take_pending().items())
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+        whens = [
+            When(
+                id=user_id,
+                then=Value(datetime.fromtimestamp(when, tz=timezone.utc)),
+            )
+            for user_id, when in batch
+        ]
+        CustomUser.objects.filter(id__in=[user_id for user_id, _ in batch]).update(
+            last_login=Case(*whens, output_field=DateTimeField())
+        )
+    return len(pending)
@@ -7,8 +7,12 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.core.cache import cache
+import json
 import random
 
+from common.cache import get_redis
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, username=None, password=None, **extra_fields):
         if not email:
@@ -49,11 +53,91 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.email or ""
 
 
+VERIFY_KEY = "verify:{}"
+VERIFY_ATTEMPTS_KEY = "verify:{}:attempts"
+VERIFY_TIMEOUT = 300  # 5 минут
+# После стольких неверных попыток код гасится, нужен новый
+VERIFY_MAX_ATTEMPTS = 5
+CONFIRMATION_OUTBOX_KEY = "confirmation:outbox"
+
+# Сравнивает код и удаляет его одной атомарной операцией,
+# возвращает ключ токена, сохранённый вместе с кодом.
+# Неверные попытки считаются там же, ARGV[2]-я гасит код
+CONSUME_CODE_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if not value then return false end
+local sep = string.find(value, ':', 1, true)
+if string.sub(value, 1, sep - 1) ~= ARGV[1] then
+    local attempts = redis.call('INCR', KEYS[2])
+    if attempts == 1 then redis.call('EXPIRE', KEYS[2], ARGV[3]) end
+    if attempts >= tonumber(ARGV[2]) then redis.call('DEL', KEYS[1], KEYS[2]) end
+    return false
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return string.sub(value, sep + 1)
+"""
+
+
 def generate_verification_code():
     return str(random.randint(100000, 999999))
 
-def store_verification_code(email):
+
+def store_verification_code(user_id, token_key):
+    """Новый код сбрасывает счётчик неверных попыток"""
     code = generate_verification_code()
-    cache_key = f'verify:{email}'
-    cache.set(cache_key, code, timeout=300)  # 5 минут = 300 секунд
+    key = VERIFY_KEY.format(user_id)
+    attempts_key = VERIFY_ATTEMPTS_KEY.format(user_id)
+    value = f"{code}:{token_key}"
+    redis = get_redis()
+    if redis is not None:
+        pipeline = redis.pipeline()
+        pipeline.set(key, value, ex=VERIFY_TIMEOUT)
+        pipeline.delete(attempts_key)
+        pipeline.execute()
+    else:
+        cache.set(key, value, timeout=VERIFY_TIMEOUT)
+        cache.delete(attempts_key)
     return code
+
+
+def consume_verification_code(user_id, code):
+    """Проверяет и гасит код; возвращает ключ токена или None.
+    VERIFY_MAX_ATTEMPTS неверных попыток гасят код"""
+    key = VERIFY_KEY.format(user_id)
+    attempts_key = VERIFY_ATTEMPTS_KEY.format(user_id)
+    redis = get_redis()
+    if redis is not None:
+        token_key = redis.eval(
+            CONSUME_CODE_SCRIPT,
+            2,
+            key,
+            attempts_key,
+            code,
+            VERIFY_MAX_ATTEMPTS,
+            VERIFY_TIMEOUT,
+        )
+        return token_key.decode() if token_key else None
+
+    value = cache.get(key)
+    if value is None:
+        return None
+    stored_code, token_key = value.split(":", 1)
+    if stored_code != code:
+        cache.add(attempts_key, 0, timeout=VERIFY_TIMEOUT)
+        if cache.incr(attempts_key) >= VERIFY_MAX_ATTEMPTS:
+            cache.delete_many([key, attempts_key])
+        return None
+    cache.delete_many([key, attempts_key])
+    return token_key
+
+
+def enqueue_confirmation_code(email, code):
+    """Ставит письмо в очередь; задача drain_confirmation_outbox
+    отправляет накопленное пачкой"""
+    from shop_api.tasks import send_confirmation_codes
+
+    redis = get_redis()
+    if redis is not None:
+        redis.rpush(CONFIRMATION_OUTBOX_KEY, json.dumps([email, code]))
+    else:
+        send_confirmation_codes.delay([[email, code]])
@@ -1,49 +1,36 @@
-import requests
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
-import os
+from users.oauth_client import OAuthError, OAuthUnavailable, get_google_client
 User = get_user_model()
 
 class GoogleAPIView(APIView):
+    throttle_scope = "auth"
     def post(self, request):
         code = request.data.get("code")
         if not code:
             return Response({"error": "Code is required"}, status=status.HTTP_400_BAD_REQUEST)
-        token_response = requests.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "code": code,
-                "client_id": os.environ.get("GOOGLE_CLIENT_ID"),
-                "client_secret": os.environ.get("GOOGLE_CLIENT_SECRET"),
-                "redirect_uri": "http://localhost:8000/api/v1/users/google-login",
-                "grant_type": "authorization_code",
-            },
-        )
-
-        token_data = token_response.json()
-
-        access_token = token_data.get("access_token")
-        if not access_token:
-            return Response({"error": "Failed to obtain access token"}, status=status.HTTP_400_BAD_REQUEST)
-        user_info_response = requests.get(
-            "https://www.googleapis.com/oauth2/v3/userinfo",
-            params={"alt": "json"},
-            headers={"Authorization": f"Bearer {access_token}"},
-        ).json()
-
-        email = user_info_response.get("email")
-        name = user_info_response.get("name")
+        try:
+            claims = get_google_client().authenticate(code)
+        except OAuthUnavailable:
+            return Response({"error": "Google is unavailable, try again later"}, status=status.HTTP_502_BAD_GATEWAY)
+        except OAuthError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
+        email = claims["email"]
         user, created = User.objects.get_or_create(
             email=email,
-            defaults={"username": email.split("@")[0], "first_name": name.split()[0], "last_name": name.split()[1] if len(name.split()) > 1 else ""}
+            defaults={
+                "username": email.split("@")[0],
+                "first_name": claims.get("given_name", ""),
+                "last_name": claims.get("family_name", ""),
+            },
         )
         refresh = RefreshToken.for_user(user)
         refresh["email"] = user.email
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token),
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GOOGLE_ISSUERS = ["https://accounts.google.com", "accounts.google.com"]
+
+
+class OAuthError(Exception):
+    """Провайдер отклонил код или токен"""
+
+
+class OAuthUnavailable(OAuthError):
+    """Провайдер не ответил вовремя или вернул 5xx"""
+
+
+def build_session(pool_size, retries):
+    # POST повторяется только при ошибке соединения: код авторизации одноразовый
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=(502, 503, 504),
+        allowed_methods={"GET"},
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class JWKSCache:
+    """Ключи подписи провайдера с TTL; неизвестный kid вызывает
+    внеочередное обновление, но не чаще min_refresh_interval"""
+
+    def __init__(self, fetch, ttl, min_refresh_interval=30):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.keys = {}
+        self.expires_at = 0
+        self.refreshed_at = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        jwks = jwt.PyJWKSet.from_dict(self.fetch())
+        self.keys = {key.key_id: key for key in jwks.keys}
+        self.refreshed_at = time.monotonic()
+        self.expires_at = self.refreshed_at + self.ttl
+
+    def get(self, kid):
+        now = time.monotonic()
+        key = self.keys.get(kid)
+        if key is not None and now < self.expires_at:
+            return key
+        with self.lock:
+            key = self.keys.get(kid)
+            stale = time.monotonic() >= self.expires_at
+            can_refresh = time.monotonic() - self.refreshed_at >= self.min_refresh_interval
+            if stale or (key is None and can_refresh):
+                self.refresh()
+                key = self.keys.get(kid)
+        if key is None:
+            raise OAuthError("Unknown signing key")
+        return key
+
+
+class GoogleOAuthClient:
+    def __init__(self, config):
+        self.config = config
+        self.timeout = config["TIMEOUT"]
+        self.session = build_session(config["POOL_SIZE"], config["RETRIES"])
+        self.jwks = JWKSCache(
+            self.fetch_jwks,
+            ttl=config["JWKS_TTL"],
+            min_refresh_interval=config["JWKS_MIN_REFRESH"],
+        )
+
+    def request(self, method, url, **kwargs):
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as exc:
+            raise OAuthUnavailable(str(exc)) from exc
+        if response.status_code >= 500:
+            raise OAuthUnavailable(f"Provider returned {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise OAuthUnavailable("Provider returned invalid JSON") from exc
+
+    def fetch_jwks(self):
+        return self.request("GET", self.config["JWKS_URL"])
+
+    def exchange_code(self, code):
+        return self.request(
+            "POST",
+            self.config["TOKEN_URL"],
+            data={
+                "code": code,
+                "client_id": self.config["CLIENT_ID"],
+                "client_secret": self.config["CLIENT_SECRET"],
+                "redirect_uri": self.config["REDIRECT_URI"],
+                "grant_type": "authorization_code",
+            },
+        )
+
+    def verify_id_token(self, id_token):
+        """Проверяет подпись и claims локально, без запроса к userinfo"""
+        try:
+            kid = jwt.get_unverified_header(id_token).get("kid")
+            key = self.jwks.get(kid)
+            return jwt.decode(
+                id_token,
+                key.key,
+                algorithms=["RS256"],
+                audience=self.config["CLIENT_ID"],
+                issuer=GOOGLE_ISSUERS,
+            )
+        except jwt.PyJWTError as exc:
+            raise OAuthError(str(exc)) from exc
+
+    def authenticate(self, code):
+        token_data = self.exchange_code(code)
+        id_token = token_data.get("id_token")
+        if not id_token:
+            raise OAuthError("Failed to obtain id token")
+        claims = self.verify_id_token(id_token)
+        if not claims.get("email") or not claims.get("email_verified"):
+            raise OAuthError("Email is not verified")
+        return claims
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_google_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GoogleOAuthClient(settings.GOOGLE_OAUTH)
+    return _client
+
+
+@receiver(setting_changed)
+def reset_google_client(setting=None, **kwargs):
+    global _client
+    if setting in (None, "GOOGLE_OAUTH"):
+        _client = None
@@ -1,11 +1,17 @@
 from datetime import date
 from rest_framework import serializers
-from django.core.cache import cache
 
 # from django.contrib.auth.models import User
 from rest_framework.exceptions import ValidationError
-from users.models import CustomUser
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework.exceptions import AuthenticationFailed
+from users.authentication import get_cached_user
+from users.tokens import CachedRefreshToken
+from users.last_login import record_login
 
 
 class UserBaseSerializer(serializers.Serializer):
@@ -21,42 +27,25 @@ class AuthValidateSerializer(serializers.Serializer):
 
 
 class RegisterValidateSerializer(UserBaseSerializer):
-    def validate_username(self, username):
-        try:
-            CustomUser.objects.get(username=username)
-        except CustomUser.DoesNotExist :
-            return username
-        raise ValidationError("User уже существует!")
-
-    def validate_email(self, email):
-        try:
-            CustomUser.objects.get(email=email)
-        except CustomUser.DoesNotExist:
-            return email
-        raise ValidationError("Email уже используется!")
+    # Уникальность email/username проверяет ограничение БД,
+    # IntegrityError превращается в ошибку валидации во view
+    unique_errors = {
+        "email": "Email уже используется!",
+        "username": "User уже существует!",
+    }
 
 
 class ConfirmationSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
     code = serializers.CharField(max_length=6)
 
-    def validate(self, attrs):
-        user_id = attrs.get("user_id")
-        code = attrs.get("confirmation_code")
-
-        try:
-            user = CustomUser.objects.get(id=user_id)
-        except CustomUser.DoesNotExist:
-            raise ValidationError("User не существует!")
-        
-        cache_key = f'verify:{user.email}'
-        stored_code = cache.get(cache_key)
-        if stored_code != code:
-            raise ValidationError("Неверный код подтверждения!")
-        return attrs
-
 
 class CustomToken(TokenObtainPairSerializer):
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        record_login(self.user.pk)
+        return data
+
     @classmethod
     def get_token(cls, user):
         if not user.birthday:
@@ -75,3 +64,33 @@ class CustomToken(TokenObtainPairSerializer):
         token["username"] = user.username
         token["birthday"] = user.birthday.strftime("%Y-%m-%d")
         return token
+
+
+class CustomTokenRefresh(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = get_cached_user(user_id)
+            if not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(
+                    self.error_messages["no_active_account"], "no_active_account"
+                )
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand_new()
+
+            data["refresh"] = str(refresh)
+
+        return data
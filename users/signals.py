@@ -0,0 +1,47 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from users.authentication import SNAPSHOT_FIELDS, invalidate_token, invalidate_user
+from users.models import CustomUser
+from users.tokens import mirror_blacklisted_on_commit
+
+
+# Пароля в снимке нет, но его смена — событие безопасности,
+# закэшированный пользователь не должен её пережить
+INVALIDATING_FIELDS = {*SNAPSHOT_FIELDS, "password"}
+
+
+def evict(invalidate, key):
+    """Сбрасывает кэш сразу и ещё раз после коммита: параллельный запрос
+    мог успеть закэшировать строку, прочитанную до коммита"""
+    invalidate(key)
+    transaction.on_commit(partial(invalidate, key))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs):
+    # Обновление одного last_login при выдаче токена снимок не меняет
+    if update_fields is not None and not set(update_fields) & INVALIDATING_FIELDS:
+        return
+    evict(invalidate_user, instance.pk)
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    evict(invalidate_user, instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    evict(invalidate_token, instance.key)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def mirror_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        mirror_blacklisted_on_commit(instance.token.jti, instance.token.expires_at)
@@ -1,2 +1,379 @@
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from redis.exceptions import RedisError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common.testing import QueryBudgetMixin
+from shop_api.tasks import mirror_blacklisted_token
+from users.authentication import USER_KEY, get_cached_user, get_local_cache
+from users.models import (
+    VERIFY_MAX_ATTEMPTS,
+    CustomUser,
+    store_verification_code,
+)
+from users.tokens import (
+    BLACKLIST_KEY,
+    BLACKLIST_SYNCED_KEY,
+    CachedRefreshToken,
+    is_blacklisted,
+)
+
+CLIENT_ID = "test-client"
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def make_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": kid, "alg": "RS256", "use": "sig"})
+    return private_key, jwk
+
+
+class StubServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Клиент закрывает соединение по таймауту — это ожидаемо
+        pass
+
+
+class GoogleStub:
+    """Локальный HTTP-сервер вместо oauth2.googleapis.com"""
+
+    def __init__(self):
+        self.private_key, jwk = make_key("key-1")
+        self.jwks = {"keys": [jwk]}
+        self.kid = "key-1"
+        self.claims = {}
+        self.delay = 0
+        self.hits = {"/token": 0, "/certs": 0}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.hits["/certs"] += 1
+                self.send_json(stub.jwks)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.hits["/token"] += 1
+                time.sleep(stub.delay)
+                self.send_json({"access_token": "x", "id_token": stub.make_id_token()})
+
+        self.server = StubServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def make_id_token(self):
+        now = int(time.time())
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "iat": now,
+            "exp": now + 300,
+            "email": "google@example.com",
+            "email_verified": True,
+            "given_name": "Ivan",
+            "family_name": "Petrov",
+            **self.claims,
+        }
+        return jwt.encode(
+            claims, self.private_key, algorithm="RS256", headers={"kid": self.kid}
+        )
+
+    def rotate_key(self):
+        self.private_key, jwk = make_key("key-2")
+        self.kid = "key-2"
+        self.jwks = {"keys": [jwk]}
+
+    def config(self, **overrides):
+        return {
+            "CLIENT_ID": CLIENT_ID,
+            "CLIENT_SECRET": "secret",
+            "REDIRECT_URI": "http://testserver/callback",
+            "TOKEN_URL": f"{self.url}/token",
+            "JWKS_URL": f"{self.url}/certs",
+            "TIMEOUT": (1, 1),
+            "RETRIES": 0,
+            "POOL_SIZE": 2,
+            "JWKS_TTL": 3600,
+            "JWKS_MIN_REFRESH": 0,
+            **overrides,
+        }
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GoogleLoginTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = GoogleStub()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.server.shutdown()
+        cls.stub.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.stub.claims = {}
+        self.stub.delay = 0
+        self.settings_override = override_settings(GOOGLE_OAUTH=self.stub.config())
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def login(self):
+        return self.client.post("/api/v1/users/google-login/", {"code": "abc"})
+
+    def test_login_verifies_id_token_locally(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data)
+        user = CustomUser.objects.get(email="google@example.com")
+        self.assertEqual((user.first_name, user.last_name), ("Ivan", "Petrov"))
+
+        certs_before = self.stub.hits["/certs"]
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.stub.hits["/certs"], certs_before)
+
+    def test_unknown_kid_refreshes_jwks(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.stub.rotate_key()
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_wrong_audience_is_rejected(self):
+        self.stub.claims = {"aud": "someone-else"}
+        self.assertEqual(self.login().status_code, 400)
+
+    def test_slow_provider_times_out(self):
+        self.stub.delay = 1.5
+        self.assertEqual(self.login().status_code, 502)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VerificationCodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            "new@example.com", "new", "Secret-password-1", is_active=False
+        )
+
+    def confirm(self, code):
+        return self.client.post(
+            "/api/v1/users/confirm/", {"user_id": self.user.id, "code": code}
+        )
+
+    def test_code_is_burned_after_max_attempts(self):
+        code = store_verification_code(self.user.id, "key")
+        wrong = "000000" if code != "000000" else "111111"
+        for _ in range(VERIFY_MAX_ATTEMPTS - 1):
+            self.assertEqual(self.confirm(wrong).status_code, 400)
+        self.assertEqual(self.confirm(code).status_code, 200)
+
+        code = store_verification_code(self.user.id, "key")
+        for _ in range(VERIFY_MAX_ATTEMPTS):
+            self.assertEqual(self.confirm(wrong).status_code, 400)
+        self.assertEqual(self.confirm(code).status_code, 400)
+
+    def test_new_code_resets_attempts(self):
+        store_verification_code(self.user.id, "key")
+        for _ in range(VERIFY_MAX_ATTEMPTS - 1):
+            self.confirm("wrong")
+        code = store_verification_code(self.user.id, "key")
+        self.confirm("wrong")
+        self.assertEqual(self.confirm(code).status_code, 200)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class TokenBlacklistTests(TestCase):
+    password = "Secret-password-1"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            "buyer@example.com", "buyer", cls.password, birthday=date(1990, 1, 1)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def refresh(self, token):
+        return self.client.post("/api/v1/users/token/refresh/", {"refresh": token})
+
+    def test_rotated_refresh_token_is_revoked(self):
+        credentials = {"email": self.user.email, "password": self.password}
+        token = self.client.post("/api/v1/users/token/", credentials).data["refresh"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.refresh(token).status_code, 200)
+        # Зеркалу доверяем без проверки по БД
+        cache.set(BLACKLIST_SYNCED_KEY, True)
+        jti = CachedRefreshToken(token, verify=False)["jti"]
+        self.assertTrue(cache.get(BLACKLIST_KEY.format(jti)))
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 401)
+
+    def test_mirror_is_written_after_commit(self):
+        token = CachedRefreshToken.for_user(self.user)
+        key = BLACKLIST_KEY.format(token["jti"])
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                token.blacklist()
+                1 / 0
+        self.assertIsNone(cache.get(key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+            self.assertIsNone(cache.get(key))
+        self.assertTrue(cache.get(key))
+
+    def test_failed_mirror_is_retried(self):
+        token = CachedRefreshToken.for_user(self.user)
+        cache.set(BLACKLIST_SYNCED_KEY, True)
+        failing = mock.patch("users.tokens.mirror_blacklisted", side_effect=RedisError)
+        retry = mock.patch("shop_api.tasks.mirror_blacklisted_token.delay")
+        with failing, retry as delay, self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+        (jti, expires_at), _ = delay.call_args
+        self.assertEqual(jti, token["jti"])
+        # Пока jti нет в зеркале, отзыв виден по БД
+        self.assertIsNone(cache.get(BLACKLIST_SYNCED_KEY))
+        self.assertTrue(is_blacklisted(jti))
+
+        mirror_blacklisted_token(jti, expires_at)
+        self.assertTrue(cache.get(BLACKLIST_KEY.format(jti)))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REPLICA_DATABASES=[],
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+)
+class AuthCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def is_cached(self):
+        key = USER_KEY.format(self.user.id)
+        return get_local_cache().get(key) is not None or key in cache
+
+    def test_deactivated_user_is_evicted(self):
+        self.assertEqual(self.client.get("/api/v1/products/my/").status_code, 200)
+        self.assertTrue(self.is_cached())
+        user = CustomUser.objects.get(id=self.user.id)
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        self.assertFalse(self.is_cached())
+        self.assertEqual(self.client.get("/api/v1/products/my/").status_code, 401)
+
+    def test_password_change_evicts_user(self):
+        get_cached_user(self.user.id)
+        self.assertTrue(self.is_cached())
+        user = CustomUser.objects.get(id=self.user.id)
+        user.set_password("New-password-1")
+        user.save(update_fields=["password"])
+        self.assertFalse(self.is_cached())
+
+    def test_user_cached_before_commit_is_evicted_after_it(self):
+        user = CustomUser.objects.get(id=self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save(update_fields=["is_active"])
+            # Параллельный запрос успел закэшировать строку до коммита
+            get_cached_user(self.user.id)
+            self.assertTrue(self.is_cached())
+        self.assertFalse(self.is_cached())
+
+    def test_last_login_keeps_user_cached(self):
+        get_cached_user(self.user.id)
+        CustomUser.objects.get(id=self.user.id).save(update_fields=["last_login"])
+        self.assertTrue(self.is_cached())
+
+
+# Сброс буфера last_login по таймеру не должен попадать в замер
+@override_settings(CACHES=LOCMEM_CACHES, LAST_LOGIN_FLUSH_INTERVAL=3600)
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    password = "Secret-password-1"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            "buyer@example.com", "buyer", cls.password, birthday=date(1990, 1, 1)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, budget, url, data):
+        return self.assertQueryBudget(budget, self.client.post, url, data)
+
+    def test_registration_and_confirmation(self):
+        data = {
+            "email": "new@example.com",
+            "username": "new",
+            "birthday": "1990-01-01",
+            "password": self.password,
+        }
+        with mock.patch("users.views.enqueue_confirmation_code") as enqueue:
+            # пользователь + токен в одной транзакции
+            response = self.post(2, "/api/v1/users/registration/", data)
+        self.assertEqual(response.status_code, 201, response.data)
+        code = enqueue.call_args.args[1]
+
+        response = self.post(
+            1,
+            "/api/v1/users/confirm/",
+            {"user_id": response.data["user_id"], "code": code},
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_token_obtain_and_refresh(self):
+        credentials = {"email": self.user.email, "password": self.password}
+        # пользователь + outstanding-токен, last_login буферизуется
+        response = self.post(2, "/api/v1/users/token/", credentials)
+        self.assertEqual(response.status_code, 200, response.data)
+
+        # старый токен в чёрный список, новый сразу вставляется
+        response = self.post(
+            6, "/api/v1/users/token/refresh/", {"refresh": response.data["refresh"]}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_authorization(self):
+        credentials = {"email": self.user.email, "password": self.password}
+        # пользователь + get_or_create токена
+        response = self.post(3, "/api/v1/users/authorization/", credentials)
+        self.assertEqual(response.status_code, 200, response.data)
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+BLACKLIST_KEY = "jwt:blacklist:{}"
+# Ставится задачей sync_token_blacklist на BLACKLIST_SYNCED_TIMEOUT и
+# снимается, если jti не удалось записать; пока его нет (например, Redis
+# перезапустили), зеркалу не доверяем и проверяем по БД
+BLACKLIST_SYNCED_KEY = "jwt:blacklist:synced"
+# Что бросает cache.set при недоступном Redis
+MIRROR_ERRORS = (RedisError, ConnectionInterrupted)
+
+
+def mirror_blacklisted(jti, expires_at):
+    """Кладёт jti в Redis на оставшийся срок жизни токена"""
+    ttl = int((expires_at - datetime.now(timezone.utc)).total_seconds())
+    if ttl > 0:
+        cache.set(BLACKLIST_KEY.format(jti), True, timeout=ttl)
+
+
+def mirror_blacklisted_on_commit(jti, expires_at):
+    """Зеркалит jti после коммита: откат не оставит в Redis лишний jti.
+    Если Redis недоступен, запись повторит задача mirror_blacklisted_token"""
+    transaction.on_commit(partial(_mirror_or_retry, jti, expires_at))
+
+
+def _mirror_or_retry(jti, expires_at):
+    from shop_api.tasks import mirror_blacklisted_token
+
+    try:
+        mirror_blacklisted(jti, expires_at)
+    except MIRROR_ERRORS:
+        # Зеркало неполное до следующей синхронизации: проверки идут в БД
+        try:
+            cache.delete(BLACKLIST_SYNCED_KEY)
+        except MIRROR_ERRORS:
+            pass
+        mirror_blacklisted_token.delay(jti, expires_at.isoformat())
+
+
+def is_blacklisted(jti):
+    key = BLACKLIST_KEY.format(jti)
+    found = cache.get_many([key, BLACKLIST_SYNCED_KEY])
+    if key in found:
+        return True
+    if BLACKLIST_SYNCED_KEY in found:
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+class CachedRefreshToken(RefreshToken):
+    """Проверяет чёрный список через Redis и не читает пользователя
+    при записи outstanding/blacklisted строк"""
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def outstanding_fields(self):
+        return {
+            "user_id": self.payload.get(api_settings.USER_ID_CLAIM),
+            "created_at": self.current_time,
+            "token": str(self),
+            "expires_at": datetime_from_epoch(self.payload["exp"]),
+        }
+
+    def outstand(self):
+        return OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM],
+            defaults=self.outstanding_fields(),
+        )
+
+    def outstand_new(self):
+        """Для только что выданного jti: вставка без предварительного SELECT"""
+        return OutstandingToken.objects.create(
+            jti=self.payload[api_settings.JTI_CLAIM], **self.outstanding_fields()
+        )
+
+    def blacklist(self):
+        token, _ = self.outstand()
+        return BlacklistedToken.objects.get_or_create(token=token)
@@ -1,4 +1,5 @@
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -8,21 +9,25 @@ from rest_framework import status
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import CreateAPIView
-from users.models import CustomUser
+from users.models import (
+    CustomUser,
+    consume_verification_code,
+    enqueue_confirmation_code,
+    store_verification_code,
+)
+from users.authentication import invalidate_user
 from .serializers import (
     RegisterValidateSerializer,
     AuthValidateSerializer,
     ConfirmationSerializer,
 )
-import random
-import string
 from drf_yasg.utils import swagger_auto_schema
 from users.serializers import CustomToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.core.cache import cache
 
 
 class AuthorizationAPIView(CreateAPIView):
+    throttle_scope = "auth"
     serializer_class = AuthValidateSerializer
 
     def post(self, request):
@@ -59,23 +64,36 @@ class RegistrationAPIView(CreateAPIView):
         username = serializer.validated_data.get("username")
         birthday = serializer.validated_data.get("birthday")
         password = serializer.validated_data["password"]
-        confirmation_code = store_verification_code(email)
-        # Use transaction to ensure data consistency
-        with transaction.atomic():
-            user = CustomUser.objects.create_user(
-                email=email,
-                username=username,
-                password=password,
-                birthday=birthday,
-                is_active=False,
-                confirmation_code=confirmation_code,
-            )
+        try:
+            with transaction.atomic():
+                user = CustomUser.objects.create_user(
+                    email=email,
+                    username=username,
+                    password=password,
+                    birthday=birthday,
+                    is_active=False,
+                )
+                token = Token.objects.create(user=user)
+        except IntegrityError as exc:
+            raise ValidationError(self.get_unique_errors(exc))
+
+        confirmation_code = store_verification_code(user.id, token.key)
+        enqueue_confirmation_code(email, confirmation_code)
 
         return Response(
             status=status.HTTP_201_CREATED,
-            data={"user_id": user.id, "confirmation_code": confirmation_code},
+            data={"user_id": user.id},
         )
 
+    def get_unique_errors(self, exc):
+        message = str(exc)
+        errors = {
+            field: [error]
+            for field, error in RegisterValidateSerializer.unique_errors.items()
+            if field in message
+        }
+        return errors or {"non_field_errors": ["User уже существует!"]}
+
 
 class ConfirmUserAPIView(APIView):
     permission_classes = [AllowAny]
@@ -85,22 +103,22 @@ class ConfirmUserAPIView(APIView):
         serializer = ConfirmationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user_id = serializer.validated_data.get("user_id")
-
-        with transaction.atomic():
-            user = CustomUser.objects.get(id=user_id)
-            user.is_active = True
-            user.save()
+        user_id = serializer.validated_data["user_id"]
+        token_key = consume_verification_code(
+            user_id, serializer.validated_data["code"]
+        )
+        if token_key is None:
+            raise ValidationError("Неверный код подтверждения!")
 
-            token, _ = Token.objects.get_or_create(user=user)
-            
-        cache_key = f'verify:{user.email}'
-        cache.delete(cache_key)  
+        CustomUser.objects.filter(id=user_id, is_active=False).update(is_active=True)
+        # update() не шлёт post_save, снимок в кэше авторизации сбрасываем сами
+        invalidate_user(user_id)
         return Response(
             status=status.HTTP_200_OK,
-            data={"message": "User аккаунт успешно активирован", "key": token.key},
+            data={"message": "User аккаунт успешно активирован", "key": token_key},
         )
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+    throttle_scope = "auth"
     serializer_class = CustomToken